@@ -5,10 +5,10 @@ from PySide6.QtWidgets import (
     QTableWidget, QTableWidgetItem,
     QGraphicsView, QGraphicsScene, QGraphicsItem,
     QGraphicsLineItem, QGraphicsTextItem,
-    QTabWidget,QDoubleSpinBox, QFormLayout, QTextEdit
+    QTabWidget,QDoubleSpinBox, QFormLayout, QTextEdit, QCheckBox
 )
 from PySide6.QtGui import QBrush, QFont, QPen,QPainterPath,QColor
-from PySide6.QtCore import Qt, QRectF
+from PySide6.QtCore import Qt, QRectF, QThread, QTimer, Signal
 
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
@@ -19,6 +19,9 @@ import time
 import mrowa2
 import genetic
 
+STOP_REASONS = {"iterations": "wszystkie iteracje", "deadline": "limit czasu", "stagnation": "brak poprawy",
+                "callback": "przerwano"} # AntColonyOptimization.stop_reason
+FLEET_COLORS = [Qt.blue, Qt.red, Qt.darkGreen, Qt.magenta, Qt.darkYellow, Qt.cyan, Qt.darkRed, Qt.darkBlue] # Kolor trasy każdego kuriera
 
 # =========================
 # CityItem
@@ -106,14 +109,16 @@ class EdgeItem(QGraphicsLineItem):
         self.pen.setWidth(2)
         self.setPen(self.pen)
         
-    def set_highlight_style(self):
-        self.pen.setColor(Qt.blue)
+    def set_highlight_style(self,color=Qt.blue):
+        self.pen.setColor(color)
         self.pen.setWidth(4)
         self.setPen(self.pen)
 # =========================
 # MapView
 # =========================
 class MapView(QGraphicsView):
+    map_cleared = Signal() # Nowa mapa: rozwiązania starej nie nadają się do ciepłego startu
+
     def __init__(self):
         super().__init__()
         self.scene = QGraphicsScene(0,0,1000, 1000)
@@ -121,8 +126,10 @@ class MapView(QGraphicsView):
         self.setFixedSize(1050, 1050)
         self.draw_grid()
 
+        self.graph_version = 0 #rośnie przy każdej zmianie miast lub krawędzi, nigdy nie wraca do zera
         self.set_variables()
         self.parcels_panel = None
+        self.editable = True #False w trakcie obliczeń, kliknięcia nie zmieniają mapy
 
     def draw_grid(self, step=20, size=1000):
         pen = QPen(QColor(100, 100, 100))
@@ -136,8 +143,12 @@ class MapView(QGraphicsView):
         self.base = None #obiekt bazy
         self.parcels = [] #lista zamowien (p_ind,d_ind,val)
         self.parcels_letters = [] #lista liter zamowien
-        self.dist_mat = [] #macierz odleglosci (lista list)
-        self.prop_mat = [] #macierz prawdopodobienstw napadu (lista list)
+        self.adjacency = {} #indeks miasta -> {indeks sąsiada: obiekt krawędzi}
+        self.mat_dirty = True #macierze liczone leniwie, dopiero gdy ktoś ich potrzebuje
+        self._dist_mat = None #macierz odleglosci (NumPy, NaN = brak krawędzi)
+        self._prop_mat = None #macierz prawdopodobienstw napadu (NumPy, NaN = brak krawędzi)
+        self.loading = False #wczytywanie z pliku: bez aktualizacji po każdym elemencie
+        self.paths = mrowa2.ShortestPathStore() #najkrótsze ścieżki, aktualizowane przy każdym nowym mieście i krawędzi
 
         self.mode = None
         self.temp_pickup = None
@@ -152,7 +163,7 @@ class MapView(QGraphicsView):
         self.temp_edge_city = None
 
     def mousePressEvent(self, event):
-        if event.button() != Qt.LeftButton: return
+        if event.button() != Qt.LeftButton or not self.editable: return
 
         pos = self.mapToScene(event.position().toPoint())
         items = self.scene.items(pos)
@@ -191,7 +202,9 @@ class MapView(QGraphicsView):
         city = CityItem(x,y, index)
         self.scene.addItem(city)
         self.cities.append(city)
-        self.update_mat()
+        self.adjacency[index] = {}
+        if not self.loading: self.paths.add_node()
+        self.graph_changed()
 
     def add_edge(self,city_a,city_b):
         if city_a == city_b: return
@@ -203,7 +216,10 @@ class MapView(QGraphicsView):
             edge = EdgeItem(city_b, city_a)
             self.scene.addItem(edge)
             self.edges[key] = edge
-            self.update_mat()
+            self.adjacency[city_a.index][city_b.index] = edge
+            self.adjacency[city_b.index][city_a.index] = edge
+            if not self.loading: self.paths.set_edge(city_a.index,city_b.index,edge.dist)
+            self.graph_changed()
 
     def get_next_letter(self):
         letter = chr(ord('A') + self.next_letter_index)
@@ -230,43 +246,71 @@ class MapView(QGraphicsView):
         for city in self.cities: self.scene.removeItem(city)
         self.parcels_panel.clear_table()
         self.set_variables()
+        self.graph_changed() # Inna mapa może mieć te same liczby miast i krawędzi
+        self.map_cleared.emit()
 
     def draw_path(self,path):
         if path == None or path == []: return
+        paths = path if isinstance(path[0],list) else [path] # Flota: lista tras, każda w innym kolorze
         if self.edges != None:
             for edge in self.edges.values():
                 edge.set_default_style()
-            for i in range(len(path)-1):
-                key = frozenset({path[i],path[i+1]})
-                edge = self.edges[key]
-                edge.set_highlight_style()
-
-    def update_mat(self):
-        if self.edges != None:
-            self.dist_mat = []
-            self.prop_mat = []
-            n = len(self.cities)
-            self.dist_mat = [[None for _ in range(n)] for _ in range(n)]
-            self.prop_mat = [[None for _ in range(n)] for _ in range(n)]
-            for edge in self.edges.values():
-                self.dist_mat[edge.city_a.index][edge.city_b.index] = edge.dist
-                self.dist_mat[edge.city_b.index][edge.city_a.index] = edge.dist
-                self.prop_mat[edge.city_a.index][edge.city_b.index] = edge.rob_prop
-                self.prop_mat[edge.city_b.index][edge.city_a.index] = edge.rob_prop
+            for vehicle, vehicle_path in enumerate(paths):
+                color = FLEET_COLORS[vehicle % len(FLEET_COLORS)]
+                for i in range(len(vehicle_path)-1):
+                    key = frozenset({vehicle_path[i],vehicle_path[i+1]})
+                    edge = self.edges[key]
+                    edge.set_highlight_style(color)
+
+    def graph_changed(self):
+        self.mat_dirty = True
+        self.graph_version += 1
+
+    @property
+    def dist_mat(self):
+        if self.mat_dirty: self.update_mat()
+        return self._dist_mat
+
+    @property
+    def prop_mat(self):
+        if self.mat_dirty: self.update_mat()
+        return self._prop_mat
+
+    def update_mat(self): # Obie macierze naraz, jednym przypisaniem po wszystkich krawędziach
+        n = len(self.cities)
+        self._dist_mat = np.full((n,n),np.nan)
+        self._prop_mat = np.full((n,n),np.nan)
+        if self.edges:
+            a = np.array([edge.city_a.index for edge in self.edges.values()])
+            b = np.array([edge.city_b.index for edge in self.edges.values()])
+            dist = np.array([edge.dist for edge in self.edges.values()],dtype=float)
+            prop = np.array([edge.rob_prop for edge in self.edges.values()],dtype=float)
+            self._dist_mat[a,b] = self._dist_mat[b,a] = dist
+            self._prop_mat[a,b] = self._prop_mat[b,a] = prop
+        self.mat_dirty = False
 
     def is_all_connected(self):
-        n = len(self.dist_mat)
-        visited = [False]*n
-        def dfs(node):
-            visited[node] = True
-            for neighbor in range(n):
-                if self.dist_mat[node][neighbor] is not None and not visited[neighbor]:
-                    dfs(neighbor)
-        dfs(0)
-        return all(visited)
+        if not self.cities: return True
+        visited = {0}
+        stack = [0]
+        while stack: # DFS po liście sąsiedztwa
+            node = stack.pop()
+            for neighbor in self.adjacency[node]:
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    stack.append(neighbor)
+        return len(visited) == len(self.cities)
 
     def upload(self,path):
         self.clear()
+        self.loading = True # Miasta i krawędzie wstawiane hurtem, najkrótsze ścieżki raz na końcu
+        try:
+            self.read_map(path)
+        finally:
+            self.loading = False
+            self.paths = mrowa2.ShortestPathStore(self.dist_mat)
+
+    def read_map(self,path):
         with open(path, "r", encoding="utf-8") as f:
             data_type = None
             for line in f:
@@ -351,6 +395,12 @@ class SimplePlot(FigureCanvas):
         self.title = title
         self.ylabel = ylabel
         self.set_params()
+        self.line, = self.ax.plot([], [], marker=".", color="#4fc3f7")
+        self.pending = None
+        self.redraw_timer = QTimer(self) # Wiele set_data w krótkim czasie -> jedno przerysowanie
+        self.redraw_timer.setSingleShot(True)
+        self.redraw_timer.setInterval(100)
+        self.redraw_timer.timeout.connect(self.redraw)
 
     def set_params(self):
         self.fig.patch.set_facecolor("#2D2D2D")
@@ -362,11 +412,55 @@ class SimplePlot(FigureCanvas):
         self.ax.grid(True, color="#555555")
 
     def set_data(self, data):
-        self.ax.clear()
-        self.set_params()
-        self.ax.plot(range(len(data)), data, marker=".", color="#4fc3f7")
+        self.pending = list(data)
+        if not self.redraw_timer.isActive(): self.redraw_timer.start()
+
+    def redraw(self):
+        data = self.pending
+        self.line.set_data(range(len(data)), data)
+        self.ax.relim()
+        self.ax.autoscale_view()
         self.draw_idle()
 
+# =========================
+# SolverWorker
+# =========================
+class SolverWorker(QThread):
+    # Obliczenia poza wątkiem GUI: postęp najwyżej co interval sekund, wynik przez sygnał (None = przerwano)
+    ant_progress = Signal(list)
+    ga_progress = Signal(list)
+    result_ready = Signal(object)
+    failed = Signal(str)
+
+    def __init__(self, job, interval=0.2):
+        super().__init__()
+        self.job = job # job(worker) -> wynik, wywoływany w wątku roboczym
+        self.interval = interval
+        self.cancelled = False
+        self.last_report = {}
+
+    def cancel(self):
+        self.cancelled = True
+
+    def report(self, signal, history):
+        now = time.time()
+        if now - self.last_report.get(signal, 0) >= self.interval:
+            self.last_report[signal] = now
+            getattr(self, signal).emit(list(history))
+        return self.cancelled # Callback algorytmu: True kończy obliczenia
+
+    def ant_callback(self, history): return self.report("ant_progress", history)
+
+    def ga_callback(self, history): return self.report("ga_progress", history)
+
+    def run(self):
+        try:
+            result = self.job(self)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.result_ready.emit(None if self.cancelled else result)
+
 # =========================
 # MainWindow
 # =========================
@@ -375,6 +469,9 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.setWindowTitle("Problem karawany - algorytm mrówkowy")
         self.resize(1700, 1000)
+        self.warm_solver = None # Ostatni solver, po zmianie samych zleceń liczymy od jego stanu
+        self.warm_key = None
+        self.worker = None # SolverWorker w trakcie obliczeń
 
         central = QWidget()
         main_layout = QVBoxLayout(central)
@@ -386,6 +483,7 @@ class MainWindow(QMainWindow):
         map_tab = QWidget()
         map_tab_layout = QHBoxLayout(map_tab)
         self.map_view = MapView()
+        self.map_view.map_cleared.connect(self.forget_warm_solver)
 
         # Lewy layout
         left_layout = QVBoxLayout()
@@ -433,8 +531,8 @@ class MainWindow(QMainWindow):
         self.parcels_panel = ParcelsPanel()
         self.map_view.parcels_panel = self.parcels_panel
 
-        clear_btn = QPushButton("Wyczyść mapę")
-        clear_btn.clicked.connect(self.map_view.clear)
+        self.clear_btn = QPushButton("Wyczyść mapę")
+        self.clear_btn.clicked.connect(self.map_view.clear)
 
         self.add_upload_btn = QPushButton("Załaduj z pliku .txt")
         self.add_upload_btn.clicked.connect(lambda: self.map_view.upload("mapa.txt"))
@@ -454,6 +552,12 @@ class MainWindow(QMainWindow):
         alpha_box = QDoubleSpinBox(); alpha_box.setRange(0.1,5.0)
         beta_box = QDoubleSpinBox(); beta_box.setRange(0.1, 10.0)
         evap_box = QDoubleSpinBox(); evap_box.setRange(0.01, 0.9); evap_box.setSingleStep(0.01)
+        joint_box = QCheckBox("Trasa wybierana po zysku netto (dystans + ochrona)")
+        km_cost_box = QDoubleSpinBox(); km_cost_box.setRange(0.0, 1000.0)
+        capacity_box = QSpinBox(); capacity_box.setRange(1,50)
+        vehicles_box = QSpinBox(); vehicles_box.setRange(1,len(FLEET_COLORS))
+        time_box = QDoubleSpinBox(); time_box.setRange(0.0,600.0)
+        patience_box = QSpinBox(); patience_box.setRange(0,1000)
 
         def set_default_ant_params():
             it_box.setValue(100)
@@ -461,6 +565,12 @@ class MainWindow(QMainWindow):
             alpha_box.setValue(1.0)
             evap_box.setValue(0.5)
             beta_box.setValue(2.0)
+            joint_box.setChecked(False)
+            km_cost_box.setValue(1.0)
+            capacity_box.setValue(1)
+            vehicles_box.setValue(1)
+            time_box.setValue(0.0)
+            patience_box.setValue(0)
         set_default_ant_params()
 
         ant_params_form.addRow("Iteracje", it_box)
@@ -468,6 +578,12 @@ class MainWindow(QMainWindow):
         ant_params_form.addRow("Alpha", alpha_box)
         ant_params_form.addRow("Beta", beta_box)
         ant_params_form.addRow("Parowanie", evap_box)
+        ant_params_form.addRow(joint_box)
+        ant_params_form.addRow("Koszt 1 km", km_cost_box)
+        ant_params_form.addRow("Pojemność kuriera (paczki)", capacity_box)
+        ant_params_form.addRow("Liczba kurierów", vehicles_box)
+        ant_params_form.addRow("Limit czasu [s] (0 = bez limitu)", time_box)
+        ant_params_form.addRow("Stop po iteracjach bez poprawy (0 = nie)", patience_box)
 
         default_params_ant_btn = QPushButton("Przywróć domyślne parametry")
         default_params_ant_btn.clicked.connect(set_default_ant_params)
@@ -482,21 +598,31 @@ class MainWindow(QMainWindow):
         pop_box = QSpinBox(); pop_box.setRange(1,500)
         gen_box = QSpinBox(); gen_box.setRange(1,500)
         mut_box = QDoubleSpinBox(); mut_box.setRange(0.01,0.9); mut_box.setSingleStep(0.01)
+        exact_box = QCheckBox("Dokładny wybór ochrony (bez GA)")
+        budget_box = QSpinBox(); budget_box.setRange(0,100000)
 
         def set_default_gen_params():
             pop_box.setValue(100)
             gen_box.setValue(200)
             mut_box.setValue(0.05)
+            exact_box.setChecked(True)
+            budget_box.setValue(0)
         set_default_gen_params()
 
         gen_params_form.addRow("Wielkosc populaji", pop_box)
         gen_params_form.addRow("Generacje", gen_box)
         gen_params_form.addRow("Mutacja", mut_box)
+        gen_params_form.addRow(exact_box)
+        gen_params_form.addRow("Budżet ochrony (0 = bez limitu)", budget_box)
 
         default_params_gen_btn = QPushButton("Przywróć domyślne parametry")
         default_params_gen_btn.clicked.connect(set_default_gen_params)
 
         compute_path_btn = QPushButton("Oblicz najkrótszą trasę z optymalnymi kupnami ochrony")
+        self.compute_path_btn = compute_path_btn
+        self.cancel_btn = QPushButton("Przerwij obliczenia")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_compute)
         compute_path_btn.clicked.connect(
             lambda: self.compute_path(
                 it_box.value(),
@@ -506,8 +632,15 @@ class MainWindow(QMainWindow):
                 evap_box.value(),
                 pop_box.value(),
                 gen_box.value(),
-                mut_box.value()
-
+                mut_box.value(),
+                exact_box.isChecked(),
+                budget_box.value(),
+                joint_box.isChecked(),
+                km_cost_box.value(),
+                capacity_box.value(),
+                vehicles_box.value(),
+                time_box.value(),
+                patience_box.value()
             )
         )
         # Komunikaty
@@ -521,7 +654,7 @@ class MainWindow(QMainWindow):
         right_layout.addWidget(self.add_base_btn)
         right_layout.addLayout(order_layout)
         right_layout.addWidget(self.parcels_panel)
-        right_layout.addWidget(clear_btn)
+        right_layout.addWidget(self.clear_btn)
         right_layout.addWidget(self.add_download_btn)
         right_layout.addWidget(self.add_upload_btn)
         right_layout.addWidget(ant_info_label)
@@ -531,6 +664,7 @@ class MainWindow(QMainWindow):
         right_layout.addLayout(gen_params_form)
         right_layout.addWidget(default_params_gen_btn)
         right_layout.addWidget(compute_path_btn)
+        right_layout.addWidget(self.cancel_btn)
         right_layout.addWidget(info_txt)
         right_layout.addWidget(self.info_label)
         right_layout.addStretch()
@@ -614,48 +748,201 @@ class MainWindow(QMainWindow):
         for i in range(n):
             for j in range(n):
                 val = matrix[i][j]
-                table.setItem(i, j, QTableWidgetItem("—" if val is None else (str(val)+unit))
+                table.setItem(i, j, QTableWidgetItem("—" if np.isnan(val) else (f"{val:g}"+unit))
                 )
     
-    def compute_path(self,iter,ants,alfa,beta,evap,pop,gen,mut):
+    def protection_costs(self):
+        const_cost = 100
+        costs = []
+        for i in range(len(self.map_view.cities)): # Koszt ochrony zależy od średniego ryzyka połączeń miasta
+            city_props = [edge.rob_prop for edge in self.map_view.adjacency[i].values()]
+            avg_prop_from_city_cost = sum(city_props)/len(city_props)/100 if city_props else 0
+            costs.append(int(const_cost*avg_prop_from_city_cost))
+        return costs
+
+    def compute_path(self,iter,ants,alfa,beta,evap,pop,gen,mut,exact=True,budget=0,joint=False,km_cost=1.0,capacity=1,vehicles=1,time_limit=0,patience=0):
         
         self.info_label.setStyleSheet("font-size: 16px; color: red;")
         if self.map_view.base == None: self.info_label.setText("Nie wybrałeś bazowego wierzchołka"); return
         if len(self.map_view.cities)<2: self.info_label.setText("Dodaj przynajmniej jeszcze jedno miasto"); return
         if not self.map_view.is_all_connected(): self.info_label.setText("Graf nie jest spójny!"); return
         if len(self.map_view.parcels)==0: self.info_label.setText("Brak zamówień, nie trzeba ruszać z bazy"); return
+        if joint and capacity>1: self.info_label.setText("Zysk netto liczony jest tylko dla jednej paczki naraz"); return
+        if vehicles>1 and capacity>1: self.info_label.setText("Flota kurierów wozi po jednej paczce"); return
+        if vehicles>1 and joint: self.info_label.setText("Flota kurierów liczona jest tylko po dystansie"); return
+        if self.worker is not None: self.info_label.setText("Obliczenia już trwają"); return
+
+        # Dane mapy kopiowane w wątku GUI, obliczenia w tle na kopiach
+        snapshot = {
+            "dist_mat": self.map_view.dist_mat,
+            "graph_version": self.map_view.graph_version,
+            "parcels": list(self.map_view.parcels),
+            "base": self.map_view.base.index,
+            "edges": {key: (edge.dist, edge.rob_prop) for key, edge in self.map_view.edges.items()},
+            "prot_costs": self.protection_costs(),
+            "start": time.time(),
+            "stop": {"time_limit": time_limit or None, "patience": patience or None}, # 0 = bez kryterium
+        }
+        ant_params = [iter,ants,alfa,beta,evap]
+        if vehicles>1:
+            snapshot.update(self.paths_snapshot())
+            job = lambda worker: self.solve_fleet_job(worker,snapshot,ant_params,pop,gen,mut,exact,vehicles)
+            self.start_worker(job,self.show_fleet)
+            return
+
+        if joint: # Mrówki oceniają trasę dystansem i kosztem ochrony / oczekiwaną stratą na każdym odcinku
+            alg = None
+            snapshot["risk_mat"] = self.map_view.prop_mat/100
+        else:
+            warm_key = (self.map_view.graph_version,snapshot["base"],ant_params,capacity) # Ten sam graf i parametry -> zmieniły się tylko zlecenia
+            alg = self.warm_solver if capacity == 1 and self.warm_key == warm_key else None
+            self.warm_key = warm_key
+        if alg is None: snapshot.update(self.paths_snapshot()) # Ciepły start liczy na macierzach poprzedniego solvera
+        self.warm_solver = None # Wróci z wynikiem, przerwany solver nie nadaje się do dalszej pracy
+        job = lambda worker: self.solve_path_job(worker,snapshot,alg,ant_params,pop,gen,mut,exact,budget,joint,km_cost,capacity)
+        self.start_worker(job,self.show_path)
+
+    def forget_warm_solver(self):
+        self.warm_solver = None
+        self.warm_key = None
+
+    def paths_snapshot(self): # Gotowe najkrótsze ścieżki albo same krawędzie, Floyd-Warshall policzy wątek roboczy
+        paths = self.map_view.paths
+        if paths.stale: return {"weights": paths.weights.copy(), "shortest_paths": None}
+        return {"weights": None, "shortest_paths": (paths.dist.copy(), paths.next_node.copy(), None, np.arange(len(paths.dist)))}
+
+    def job_paths(self,snapshot): # Wątek roboczy
+        if snapshot["shortest_paths"] is None:
+            dist, next_node = mrowa2._floyd_warshall_arrays(snapshot["weights"].copy()) # Krawędzie zostają dla adopt
+            snapshot["shortest_paths"] = (dist, next_node, None, np.arange(len(dist)))
+        return snapshot["shortest_paths"]
+
+    def adopt_paths(self,snapshot): # Ścieżki policzone w tle wracają do magazynu, o ile graf się w międzyczasie nie zmienił
+        if snapshot.get("weights") is None or snapshot["shortest_paths"] is None: return
+        if snapshot["graph_version"] != self.map_view.graph_version: return
+        dist, next_node, _, _ = snapshot["shortest_paths"]
+        self.map_view.paths.adopt(dist.copy(), next_node.copy(), snapshot["weights"]) # Solver zostaje z własnymi tablicami
+
+    def start_worker(self,job,on_result):
+        self.worker = SolverWorker(job)
+        self.worker.ant_progress.connect(self.distance_plot.set_data)
+        self.worker.ga_progress.connect(self.profit_plot.set_data)
+        self.worker.result_ready.connect(on_result)
+        self.worker.failed.connect(self.show_error)
+        self.worker.finished.connect(self.worker_finished)
+        self.compute_path_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.set_map_editable(False) # Wynik musi pasować do mapy, z której powstał
+        self.info_label.setStyleSheet("font-size: 16px; color: white;")
+        self.info_label.setText("Trwają obliczenia...")
+        self.worker.start()
+
+    def cancel_compute(self):
+        if self.worker is not None: self.worker.cancel()
+
+    def worker_finished(self):
+        self.worker.deleteLater()
+        self.worker = None
+        self.compute_path_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        self.set_map_editable(True)
+
+    def set_map_editable(self,editable):
+        for widget in (self.add_city_btn,self.add_edge_btn,self.add_base_btn,self.add_parcel_btn,self.clear_btn,self.add_upload_btn):
+            widget.setEnabled(editable)
+        self.map_view.set_mode(None)
+        self.map_view.editable = editable
+
+    def closeEvent(self,event):
+        if self.worker is not None: # Wątek nie może przeżyć okna
+            self.worker.cancel()
+            self.worker.wait()
+        super().closeEvent(event)
+
+    def show_error(self,message):
+        self.info_label.setStyleSheet("font-size: 16px; color: red;")
+        self.info_label.setText(f"Błąd obliczeń: {message}")
 
-        start_timer = time.time()
+    def show_cancelled(self):
+        self.info_label.setStyleSheet("font-size: 16px; color: red;")
+        self.info_label.setText("Obliczenia przerwane")
 
-        alg_dist_mat = np.array(self.map_view.dist_mat,dtype=object)
-        parcels = self.map_view.parcels
-        base = self.map_view.base.index
-        ant_params = [iter,ants,alfa,beta,evap]
-        
-        alg = mrowa2.AntColonyOptimization(alg_dist_mat,parcels,base,ant_params)
-        best_path, best_dist, ant_history, orders_sequence = alg.solve()
-        best_path = [int(x) for x in best_path] 
-        ant_history = [int(x) for x in ant_history]
+    def is_stale(self,result):
+        if result["snapshot"]["graph_version"] == self.map_view.graph_version: return False
+        self.info_label.setStyleSheet("font-size: 16px; color: red;")
+        self.info_label.setText("Mapa zmieniła się w trakcie obliczeń, wynik odrzucono")
+        return True
 
-        self.map_view.draw_path(best_path)
+    def remaining_stop(self,snapshot): # Limit czasu dotyczy całego zadania: kolejny etap dostaje tylko to, co zostało
+        stop = dict(snapshot["stop"])
+        if stop["time_limit"] is not None:
+            stop["time_limit"] = max(0.0,stop["time_limit"]-(time.time()-snapshot["start"]))
+        return stop
 
+    def route_input(self,snapshot,path): #Generowanie trasy jako wejscie do ag
         trasa_input = []
-        for i in range(len(best_path)-1): #Generowanie trasy jako wejscie do ag
-            ind = best_path [i]
-            next_ind = best_path[i+1]
-            edge = self.map_view.edges[frozenset({ind,next_ind})]
-            rob_prop = (edge.rob_prop)/100
-            city_props = [x for x in self.map_view.prop_mat[ind] if x is not None]
-            avg_prop_from_city_cost = sum(city_props)/len(city_props)/100
-            const_cost = 100
-            prot_cost = int(const_cost*avg_prop_from_city_cost)
-            trasa_input.append((ind,rob_prop,prot_cost))
-
-        ga = genetic.SingleCargoGA(trasa_input,parcels,pop,gen,mut)
-        buy_protect, ga_history = ga.run()
+        for ind, next_ind in zip(path, path[1:]):
+            _, rob_prop = snapshot["edges"][frozenset({ind,next_ind})]
+            trasa_input.append((ind,rob_prop/100,snapshot["prot_costs"][ind]))
+        return trasa_input
+
+    def solve_path_job(self,worker,snapshot,alg,ant_params,pop,gen,mut,exact,budget,joint,km_cost,capacity): # Wątek roboczy
+        parcels = snapshot["parcels"]
+        base = snapshot["base"]
+        if joint:
+            alg = mrowa2.AntColonyOptimization(snapshot["dist_mat"],parcels,base,ant_params,objective="profit",
+                                               risk_matrix=snapshot["risk_mat"],protection_cost=snapshot["prot_costs"],
+                                               distance_cost=km_cost,shortest_paths=self.job_paths(snapshot),
+                                               should_stop=lambda: worker.cancelled)
+            if worker.cancelled: return None
+            best_path, best_dist, ant_history, orders_sequence = alg.solve(worker.ant_callback,**self.remaining_stop(snapshot))
+        elif alg is not None:
+            best_path, best_dist, ant_history, orders_sequence = alg.warm_start(parcels,iterations=max(5,ant_params[0]//10),
+                                                                                callback=worker.ant_callback,**self.remaining_stop(snapshot))
+        else:
+            alg = mrowa2.AntColonyOptimization(snapshot["dist_mat"],parcels,base,ant_params,capacity=capacity,
+                                               shortest_paths=self.job_paths(snapshot))
+            best_path, best_dist, ant_history, orders_sequence = alg.solve(worker.ant_callback,**self.remaining_stop(snapshot))
+        if worker.cancelled: return None
+
+        if capacity>1: events = alg.decode_events(orders_sequence) # Odbiory i dostawy przeplatane
+        else: events = [(o,kind) for o in orders_sequence for kind in ("p","d")]
+        best_path = [int(x) for x in best_path] 
+        ant_history = [int(x) for x in ant_history]
+        net_profit = alg.net_profit() if joint else None # Przychód minus koszt trasy liczony przez mrówki
+        if joint: best_dist = sum(snapshot["edges"][frozenset({a,b})][0] for a,b in zip(best_path,best_path[1:]))
+
+        trasa_input = self.route_input(snapshot,best_path)
+        if budget > 0: # Ograniczony budżet na ochronę
+            planner = genetic.ProtectionPlanner(trasa_input,parcels,budget,pop_size=pop,generations=gen,mutation_rate=mut,
+                                                capacity=capacity,events=events)
+            buy_protect, ga_history = planner.run(worker.ga_callback,**self.remaining_stop(snapshot))
+        else:
+            ga = genetic.SingleCargoGA(trasa_input,parcels,pop,gen,mut,capacity=capacity,events=events)
+            buy_protect, ga_history = ga.run_exact() if exact else ga.run(worker.ga_callback,**self.remaining_stop(snapshot))
+        return {"alg": None if joint else alg, "snapshot": snapshot, "stop_reason": alg.stop_reason, "best_path": best_path, "best_dist": best_dist,
+                "net_profit": net_profit,
+                "ant_history": ant_history, "events": events, "trasa_input": trasa_input,
+                "buy_protect": buy_protect, "ga_history": ga_history}
+
+    def show_path(self,result):
+        if result is None: self.show_cancelled(); return
+        if self.is_stale(result): return
+        self.warm_solver = result["alg"]
+        snapshot = result["snapshot"]
+        self.adopt_paths(snapshot)
+        parcels = snapshot["parcels"]
+        base = snapshot["base"]
+        best_path = result["best_path"]
+        best_dist = result["best_dist"]
+        events = result["events"]
+        trasa_input = result["trasa_input"]
+        buy_protect = result["buy_protect"]
+        ga_history = result["ga_history"]
         best_score = ga_history[-1]
-        
-        self.distance_plot.set_data(ant_history)
+
+        self.map_view.draw_path(best_path)
+        self.distance_plot.set_data(result["ant_history"])
         self.profit_plot.set_data(ga_history)
         self.toggle_matrix()
         self.info_label.setStyleSheet("font-size: 16px; color: white;")
@@ -666,7 +953,7 @@ class MainWindow(QMainWindow):
         path_txt = "Trasa: "
         path_list_txt = "Lista kroków: | krok | skąd |dokąd | paczka | wartość paczki | czy ochrona | koszt ochrony \n"
 
-        has_parcel = False
+        loaded = [] # Paczki na pokładzie
         parcel_letters = self.map_view.parcels_letters
         cities_protected = []
         seq_idx = 0
@@ -677,19 +964,14 @@ class MainWindow(QMainWindow):
 
             path_txt += f"{node} "
 
-            if has_parcel: # Paczka
-                pickup, delivery, _ = parcels[parcel_id]
-                if node == delivery:
-                    has_parcel = False
-                    path_txt += f"{parcel_letter}d "
-                    seq_idx += 1
-            elif seq_idx < len(orders_sequence):
-                parcel_id = orders_sequence[seq_idx]
-                parcel_letter = parcel_letters[parcel_id]
+            while seq_idx < len(events): # Odbiory i dostawy w tym wierzchołku
+                parcel_id, kind = events[seq_idx]
                 pickup, delivery, _ = parcels[parcel_id]
-                if node == pickup:
-                    has_parcel = True
-                    path_txt += f"{parcel_letter}p "
+                if node != (pickup if kind == "p" else delivery): break
+                if kind == "p": loaded.append(parcel_id)
+                else: loaded.remove(parcel_id)
+                path_txt += f"{parcel_letters[parcel_id]}{kind} "
+                seq_idx += 1
             
             path_txt += "--"
             if buy_protect[step_idx]: 
@@ -698,8 +980,9 @@ class MainWindow(QMainWindow):
             path_txt += "-> "  # Strzałka
 
             path_list_txt += f"{step_idx} | {node} | {next_node} "
-            if has_parcel: 
-                path_list_txt += f"| {parcel_letter} | {parcels[parcel_id][2]} "
+            if loaded: 
+                letters = ",".join(parcel_letters[i] for i in loaded)
+                path_list_txt += f"| {letters} | {sum(parcels[i][2] for i in loaded)} "
                 if buy_protect[step_idx]: path_list_txt += f"| Tak | {trasa_input[step_idx][2]}"
                 else: path_list_txt += f"| Nie | ---"
             path_list_txt += "\n"
@@ -709,19 +992,75 @@ class MainWindow(QMainWindow):
         self.path_txt_label.setText(path_txt)
 
         letters_order = []
-        for i in orders_sequence: letters_order.append(parcel_letters[i])
+        for i, kind in events:
+            if kind == "p": letters_order.append(parcel_letters[i])
 
         results_txt = "Wyniki:\n"
         results_txt += f"Kolejność odwiedzanych wierzchołków: {best_path}\n"
         results_txt += f"Dystans trasy: {best_dist:.3f} km\n"
+        results_txt += f"Mrówki zatrzymane: {STOP_REASONS[result['stop_reason']]} po {len(result['ant_history'])} iteracjach\n"
         results_txt += f"Kolejność wykonywanych zleceń: {letters_order}\n"
         results_txt += f"Wierzchołki w których kupiono ochronę: {cities_protected}\n"
+        if result["net_profit"] is not None: results_txt += f"Zysk netto trasy (ocena mrówek): {result['net_profit']:.0f}\n"
         results_txt += f"Przewidywany zarobek: {best_score:.0f}\n"
-        results_txt += f"Czas wykonywania algorytmu: {time.time()-start_timer:.3f}s\n"
+        results_txt += f"Czas wykonywania algorytmu: {time.time()-snapshot['start']:.3f}s\n"
         results_txt += path_list_txt
         self.results_label.setText(results_txt)
 
 
+    def solve_fleet_job(self,worker,snapshot,ant_params,pop,gen,mut,exact,vehicles): # Wątek roboczy
+        parcels = snapshot["parcels"]
+        paths, fleet_dist, ant_history, plan, route_dists = mrowa2.solve_fleet(snapshot["dist_mat"],parcels,snapshot["base"],ant_params,
+                                                                               vehicles=vehicles,shortest_paths=self.job_paths(snapshot),
+                                                                               callback=worker.ant_callback,**self.remaining_stop(snapshot))
+        if worker.cancelled: return None
+        paths = [[int(x) for x in path] for path in paths]
+
+        routes = []
+        ga_history = []
+        for path, order_seq in zip(paths, plan):
+            if not order_seq: routes.append(None); continue
+            ga = genetic.SingleCargoGA(self.route_input(snapshot,path),[parcels[i] for i in order_seq],pop,gen,mut,
+                                      events=[(i,kind) for i in range(len(order_seq)) for kind in ("p","d")])
+            buy_protect, history = ga.run_exact() if exact else ga.run(worker.ga_callback,**self.remaining_stop(snapshot))
+            if worker.cancelled: return None
+            routes.append((buy_protect, history))
+            if len(history) > len(ga_history): ga_history += [0]*(len(history)-len(ga_history))
+            for i, fit in enumerate(history): ga_history[i] += fit # Zysk całej floty w każdej generacji
+        return {"snapshot": snapshot, "paths": paths, "fleet_dist": fleet_dist, "ant_history": [int(x) for x in ant_history],
+                "plan": plan, "route_dists": route_dists, "routes": routes, "ga_history": ga_history}
+
+    def show_fleet(self,result):
+        if result is None: self.show_cancelled(); return
+        if self.is_stale(result): return
+        self.adopt_paths(result["snapshot"])
+        paths = result["paths"]
+        self.map_view.draw_path(paths)
+
+        parcel_letters = self.map_view.parcels_letters
+        results_txt = "Wyniki:\n"
+        results_txt += f"Najdłuższa trasa kuriera: {result['fleet_dist']:.3f} km\n"
+        total_score = 0
+        for vehicle, (path, order_seq, dist, route) in enumerate(zip(paths, result["plan"], result["route_dists"], result["routes"])):
+            if route is None: results_txt += f"Kurier {vehicle+1}: bez zleceń\n"; continue
+            buy_protect, history = route
+            total_score += history[-1]
+            protected = [node for node, buy in zip(path, buy_protect) if buy]
+            results_txt += f"Kurier {vehicle+1}: trasa {path}, {dist:.3f} km, zlecenia {[parcel_letters[i] for i in order_seq]}, " \
+                           f"ochrona w {protected}, zarobek {history[-1]:.0f}\n"
+
+        self.distance_plot.set_data(result["ant_history"])
+        self.profit_plot.set_data(result["ga_history"])
+        self.toggle_matrix()
+        self.info_label.setStyleSheet("font-size: 16px; color: white;")
+        self.info_label.setText(f'Obliczono trasy dla {len(paths)} kurierów (każdy w innym kolorze)' \
+        '                      \nDokładne informacje o trasach w zakładce "wyniki"')
+        self.path_txt_label.setText("\n".join(f"Kurier {v+1}: " + " -> ".join(map(str,path)) for v, path in enumerate(paths)))
+
+        results_txt += f"Przewidywany zarobek floty: {total_score:.0f}\n"
+        results_txt += f"Czas wykonywania algorytmu: {time.time()-result['snapshot']['start']:.3f}s\n"
+        self.results_label.setText(results_txt)
+
 
 # =========================
 # START
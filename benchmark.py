@@ -0,0 +1,283 @@
+import argparse
+import time
+
+import numpy as np
+
+import genetic
+import mrowa2
+
+
+def random_graph(size, missing=0.3, seed=42):
+    """Losowa macierz odległości z None tam, gdzie brak połączenia (jak w demo mrowa2)"""
+    rng = np.random.default_rng(seed)
+    dist_m = rng.integers(10, 101, size=(size, size)).astype(object)
+    dist_m = np.triu(dist_m, 1) + np.triu(dist_m, 1).T
+    dist_m[rng.random((size, size)) < missing] = None
+    dist_m = np.where(np.equal(dist_m.T, None), None, dist_m)  # Symetryczne braki połączeń
+    np.fill_diagonal(dist_m, None)
+    return dist_m
+
+
+def bench_floyd_warshall(args):
+    print(f"{'Miasta':>7} | {'Pętla [s]':>10} | {'NumPy [s]':>10} | {'Przyspieszenie':>14}")
+    print("-" * 52)
+    for size in args.sizes:
+        matrix = random_graph(size, seed=args.seed)
+        aco = mrowa2.AntColonyOptimization(matrix, [], 0, (1, 1, 1.0, 1.0, 0.1))
+
+        start = time.perf_counter()
+        dist_np, next_np = aco._floyd_warshall_numpy(matrix)
+        t_numpy = time.perf_counter() - start
+
+        if args.loop_limit is not None and size > args.loop_limit:
+            print(f"{size:>7} | {'pominięto':>10} | {t_numpy:>10.4f} | {'-':>14}")
+            continue
+
+        start = time.perf_counter()
+        dist_loop, next_loop = aco._floyd_warshall_with_path(matrix)
+        t_loop = time.perf_counter() - start
+
+        assert np.allclose(dist_loop, dist_np), "Różne odległości w silnikach"
+        print(f"{size:>7} | {t_loop:>10.4f} | {t_numpy:>10.4f} | {t_loop / t_numpy:>13.1f}x")
+
+
+def random_orders(size, count, seed=42):
+    rng = np.random.default_rng(seed)
+    orders = []
+    for _ in range(count):
+        p_node, d_node = rng.choice(size, 2, replace=False)
+        orders.append((int(p_node), int(d_node), int(rng.integers(50, 150))))
+    return orders
+
+
+def bench_colony(args):
+    matrix = random_graph(args.cities, seed=args.seed)
+    orders = random_orders(args.cities, args.orders, seed=args.seed)
+    aco = mrowa2.AntColonyOptimization(matrix, orders, 0, (1, args.ants, 1.0, 2.0, 0.1),
+                                      candidates=args.candidates)
+
+    np.random.seed(args.seed)
+    start = time.perf_counter()
+    seq_dists = [aco._run_ant()[0] for _ in range(args.rounds * args.ants)]
+    t_seq = (time.perf_counter() - start) / args.rounds
+
+    np.random.seed(args.seed)
+    start = time.perf_counter()
+    batch_dists = np.concatenate([aco._run_colony()[0] for _ in range(args.rounds)])
+    t_batch = (time.perf_counter() - start) / args.rounds
+
+    print(f"Mrówki: {args.ants}, zlecenia: {args.orders}, miasta: {args.cities}")
+    print(f"{'Tryb':<12} | {'Iteracja [s]':>12} | {'Średni dystans':>14} | {'Odch. std':>10}")
+    print("-" * 58)
+    print(f"{'sequential':<12} | {t_seq:>12.4f} | {np.mean(seq_dists):>14.1f} | {np.std(seq_dists):>10.1f}")
+    print(f"{'batched':<12} | {t_batch:>12.4f} | {np.mean(batch_dists):>14.1f} | {np.std(batch_dists):>10.1f}")
+    print(f"Przyspieszenie: {t_seq / t_batch:.1f}x")
+    if args.candidates is not None:
+        print(f"Brak kandydatów (pełny wybór): {aco.candidate_fallback_rate():.1%} decyzji")
+
+
+def bench_multi_colony(args):
+    matrix = random_graph(args.cities, seed=args.seed)
+    orders = random_orders(args.cities, args.orders, seed=args.seed)
+    params = (args.iterations, args.ants, 1.0, 2.0, 0.1)
+
+    print(f"Kolonie: {args.colonies}, mrówki: {args.ants}, zlecenia: {args.orders}, iteracje: {args.iterations}")
+    print(f"{'Procesy':>7} | {'Czas [s]':>9} | {'Przyspieszenie':>14} | {'Najlepszy dystans':>17}")
+    print("-" * 57)
+    base_time = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        result = mrowa2.solve_multi_colony(matrix, orders, 0, params, colonies=args.colonies,
+                                           migration_interval=args.migration, workers=workers,
+                                           seed=args.seed, construction="batched")
+        elapsed = time.perf_counter() - start
+        base_time = base_time or elapsed
+        print(f"{workers:>7} | {elapsed:>9.3f} | {base_time / elapsed:>13.1f}x | {result[1]:>17.1f}")
+
+
+def time_to_target(aco, target, max_iterations):
+    aco.iterations = 1                                          # solve() continues from the current state
+    start = time.perf_counter()
+    for iteration in range(1, max_iterations + 1):
+        aco.solve()
+        if aco.global_best_dist <= target:
+            return time.perf_counter() - start, iteration
+    return None, max_iterations
+
+
+def bench_local_search(args):
+    print(f"Mrówki: {args.ants}, zlecenia: {args.orders}, cel: najlepszy znany + {args.gap:.0%} (- = nie osiągnięto)")
+    print(f"{'Instancja':>9} | {'Cel':>8} | {'Bez LS [s]':>10} | {'Iter':>5} | {'Z LS [s]':>9} | {'Iter':>5}")
+    print("-" * 62)
+    for instance in range(args.instances):
+        seed = args.seed + instance
+        matrix = random_graph(args.cities, seed=seed)
+        orders = random_orders(args.cities, args.orders, seed=seed)
+        params = (args.iterations, args.ants, 1.0, 2.0, 0.1)
+
+        np.random.seed(seed)
+        reference = mrowa2.AntColonyOptimization(matrix, orders, 0, params, construction="batched", local_search=True)
+        target = reference.solve()[1] * (1 + args.gap)     # Best known distance from a long run with local search
+
+        row = []
+        for local_search in (False, True):
+            np.random.seed(seed + 1)
+            aco = mrowa2.AntColonyOptimization(matrix, orders, 0, params, construction="batched",
+                                               local_search=local_search)
+            elapsed, iterations = time_to_target(aco, target, args.iterations)
+            row.append(("-" if elapsed is None else f"{elapsed:.3f}", iterations))
+        print(f"{instance:>9} | {target:>8.1f} | {row[0][0]:>10} | {row[0][1]:>5} | {row[1][0]:>9} | {row[1][1]:>5}")
+
+
+def bench_mmas(args):
+    # Same instance and seed for both rules; target = best tour of either run + gap
+    print(f"Mrówki: {args.ants}, zlecenia: {args.orders}, iteracje: {args.iterations}, "
+          f"cel: najlepszy z obu + {args.gap:.0%} (- = nie osiągnięto)")
+    print(f"{'Instancja':>9} | {'Reguła':<8} | {'Po 1/4':>8} | {'Po 1/2':>8} | {'Koniec':>8} | "
+          f"{'Iter do celu':>12} | {'Czas [s]':>8} | {'Restarty':>8}")
+    print("-" * 92)
+    for instance in range(args.instances):
+        seed = args.seed + instance
+        matrix = random_graph(args.cities, seed=seed)
+        orders = random_orders(args.cities, args.orders, seed=seed)
+        params = (args.iterations, args.ants, 1.0, 2.0, 0.1)
+
+        runs = []
+        for rule in ("elitist", "mmas"):
+            np.random.seed(seed + 1)
+            aco = mrowa2.AntColonyOptimization(matrix, orders, 0, params, construction="batched",
+                                               pheromone_rule=rule, local_search=args.local_search)
+            start = time.perf_counter()
+            aco.solve()
+            best = np.minimum.accumulate(aco.history_best_dist)       # Best so far after every iteration
+            runs.append((rule, best, time.perf_counter() - start, aco.mmas_restarts))
+
+        target = min(best[-1] for _, best, _, _ in runs) * (1 + args.gap)
+        for rule, best, elapsed, restarts in runs:
+            reached = np.flatnonzero(best <= target)
+            hit = "-" if len(reached) == 0 else str(reached[0] + 1)
+            quarter, half = best[max(0, len(best) // 4 - 1)], best[max(0, len(best) // 2 - 1)]
+            print(f"{instance:>9} | {rule:<8} | {quarter:>8.1f} | {half:>8.1f} | {best[-1]:>8.1f} | "
+                  f"{hit:>12} | {elapsed:>8.2f} | {restarts:>8}")
+
+
+def random_route(length, orders, seed=42):
+    rng = np.random.default_rng(seed)
+    nodes = rng.integers(0, max(2, length // 4), size=length)
+    route = [(int(n), float(rng.uniform(0.0, 0.5)), int(rng.integers(5, 100))) for n in nodes]
+    parcels = []
+    for _ in range(orders):
+        p_node, d_node = rng.choice(nodes, 2, replace=False)
+        parcels.append((int(p_node), int(d_node), int(rng.integers(50, 1000))))
+    return route, parcels
+
+
+def bench_genetic(args):
+    route, parcels = random_route(args.length, args.orders, seed=args.seed)
+    print(f"Trasa: {args.length} kroków, populacja: {args.pop_size}, generacje: {args.gen}")
+    print(f"{'Tryb':<11} | {'Generacja [ms]':>14} | {'Najlepszy zysk':>14}")
+    print("-" * 46)
+    for vectorized in (False, True):
+        ga = genetic.SingleCargoGA(route, parcels, pop_size=args.pop_size, generations=args.gen,
+                                   vectorized=vectorized)
+        start = time.perf_counter()
+        _, history = ga.run()
+        elapsed = (time.perf_counter() - start) / args.gen * 1000
+        print(f"{'numpy' if vectorized else 'lista':<11} | {elapsed:>14.2f} | {history[-1]:>14.1f}")
+
+
+def bench_protection(args):
+    print(f"Budżet: {args.budget_share:.0%} kosztu opłacalnej ochrony")
+    print(f"{'Kroki':>6} | {'DP [s]':>8} | {'Lagrange [s]':>12} | {'Zysk DP':>11} | {'Zysk Lagrange':>13}")
+    print("-" * 64)
+    for length in args.lengths:
+        route, parcels = random_route(length, max(2, length // 40), seed=args.seed)
+        ga = genetic.SingleCargoGA(route, parcels)
+        profitable_steps = ga.cost_security < ga.expected_loss
+        profitable = ga.cost_security[profitable_steps].sum()
+        budget = int(profitable * args.budget_share)
+
+        row = []
+        dp_cells = int(profitable_steps.sum()) * (budget + 1)   # tablica DP: 1 bajt na komórkę
+        for dp_limit in (float('inf'), 0):          # 0 wymusza relaksację Lagrange'a
+            if dp_limit and dp_cells > args.dp_cap:
+                row.append(None)
+                continue
+            planner = genetic.ProtectionPlanner(route, parcels, budget=budget, dp_limit=dp_limit)
+            start = time.perf_counter()
+            _, history = planner.run()
+            row.append((time.perf_counter() - start, history[-1]))
+        dp_time, dp_profit = (f"{row[0][0]:>8.4f}", f"{row[0][1]:>11.1f}") if row[0] else (f"{'-':>8}", f"{'-':>11}")
+        print(f"{length:>6} | {dp_time} | {row[1][0]:>12.4f} | {dp_profit} | {row[1][1]:>13.1f}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmarki SmartPath-Delivery")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    fw = sub.add_parser("fw", help="Floyd-Warshall: pętla vs NumPy")
+    fw.add_argument('--sizes', type=int, nargs='+', default=[50, 200, 1000], help='Liczby miast')
+    fw.add_argument('--loop_limit', type=int, default=None, help='Pomiń pętlę dla większych grafów')
+    fw.add_argument('--seed', type=int, default=42, help='Ziarno losowania grafu')
+    fw.set_defaults(func=bench_floyd_warshall)
+
+    colony = sub.add_parser("colony", help="Budowa tras: mrówka po mrówce vs cała kolonia naraz")
+    colony.add_argument('--ants', type=int, default=60, help='Liczba mrówek')
+    colony.add_argument('--orders', type=int, default=200, help='Liczba zleceń')
+    colony.add_argument('--cities', type=int, default=300, help='Liczba miast')
+    colony.add_argument('--rounds', type=int, default=3, help='Liczba powtórzeń iteracji')
+    colony.add_argument('--candidates', type=int, default=None, help='Liczba najbliższych odbiorów (lista kandydatów)')
+    colony.add_argument('--seed', type=int, default=42, help='Ziarno losowania')
+    colony.set_defaults(func=bench_colony)
+
+    multi = sub.add_parser("colonies", help="Skalowanie wielu kolonii na procesach")
+    multi.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='Liczby procesów')
+    multi.add_argument('--colonies', type=int, default=16, help='Liczba kolonii')
+    multi.add_argument('--migration', type=int, default=10, help='Co ile iteracji migracja')
+    multi.add_argument('--iterations', type=int, default=50, help='Liczba iteracji')
+    multi.add_argument('--ants', type=int, default=60, help='Liczba mrówek')
+    multi.add_argument('--orders', type=int, default=100, help='Liczba zleceń')
+    multi.add_argument('--cities', type=int, default=300, help='Liczba miast')
+    multi.add_argument('--seed', type=int, default=42, help='Ziarno losowania')
+    multi.set_defaults(func=bench_multi_colony)
+
+    ls = sub.add_parser("local_search", help="Czas dojścia do celu: ACO vs ACO + przeszukiwanie lokalne")
+    ls.add_argument('--instances', type=int, default=5, help='Liczba instancji')
+    ls.add_argument('--gap', type=float, default=0.05, help='Dopuszczalna odległość od najlepszego znanego')
+    ls.add_argument('--iterations', type=int, default=200, help='Limit iteracji')
+    ls.add_argument('--ants', type=int, default=40, help='Liczba mrówek')
+    ls.add_argument('--orders', type=int, default=200, help='Liczba zleceń')
+    ls.add_argument('--cities', type=int, default=300, help='Liczba miast')
+    ls.add_argument('--seed', type=int, default=42, help='Ziarno losowania')
+    ls.set_defaults(func=bench_local_search)
+
+    mmas = sub.add_parser("mmas", help="Aktualizacja feromonów: elitarne mrówki vs MAX-MIN Ant System")
+    mmas.add_argument('--instances', type=int, default=5, help='Liczba instancji')
+    mmas.add_argument('--gap', type=float, default=0.01, help='Dopuszczalna odległość od najlepszej trasy obu reguł')
+    mmas.add_argument('--iterations', type=int, default=300, help='Liczba iteracji')
+    mmas.add_argument('--ants', type=int, default=30, help='Liczba mrówek')
+    mmas.add_argument('--orders', type=int, default=50, help='Liczba zleceń')
+    mmas.add_argument('--cities', type=int, default=200, help='Liczba miast')
+    mmas.add_argument('--local_search', action='store_true', help='Obie reguły z przeszukiwaniem lokalnym')
+    mmas.add_argument('--seed', type=int, default=42, help='Ziarno losowania')
+    mmas.set_defaults(func=bench_mmas)
+
+    ga = sub.add_parser("genetic", help="GA ochrony: populacja jako listy vs macierz NumPy")
+    ga.add_argument('--length', type=int, default=2000, help='Długość trasy')
+    ga.add_argument('--orders', type=int, default=50, help='Liczba zleceń')
+    ga.add_argument('--pop_size', type=int, default=500, help='Rozmiar populacji')
+    ga.add_argument('--gen', type=int, default=5, help='Liczba generacji')
+    ga.add_argument('--seed', type=int, default=42, help='Ziarno losowania')
+    ga.set_defaults(func=bench_genetic)
+
+    prot = sub.add_parser("protection", help="Ochrona z budżetem: plecak DP vs relaksacja Lagrange'a")
+    prot.add_argument('--lengths', type=int, nargs='+', default=[20, 200, 2000, 20000], help='Długości tras')
+    prot.add_argument('--budget_share', type=float, default=0.5, help='Budżet jako część kosztu opłacalnej ochrony')
+    prot.add_argument('--dp_cap', type=int, default=200_000_000,
+                      help='Pomiń DP, gdy tablica (kroki x budżet) ma więcej komórek')
+    prot.add_argument('--seed', type=int, default=42, help='Ziarno losowania')
+    prot.set_defaults(func=bench_protection)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -1,75 +1,128 @@
 import random
+import time
 import argparse
+from collections import OrderedDict, defaultdict, deque
+import numpy as np
 import matplotlib.pyplot as plt
 
+# Kody akcji na kroku trasy (tablica cargo_actions)
+ACTION_EMPTY, ACTION_LOAD, ACTION_CARRY, ACTION_UNLOAD = 0, 1, 2, 3
+ACTION_NAMES = ('empty', 'load', 'carry', 'unload')
+
 class SingleCargoGA:
     def __init__(self, route_data, orders, 
-                 pop_size=100, generations=200, mutation_rate=0.05):
+                 pop_size=100, generations=200, mutation_rate=0.05, vectorized=False,
+                 cache_size=10000, capacity=1, events=None):
         self.route_data = route_data
         self.orders = orders
         self.route_len = len(route_data)
+        self.capacity = capacity        # ile paczek kurier wiezie naraz
+        self.events = events            # plan kolonii [(id zlecenia, 'p' / 'd')], None = ładuj po drodze
      
         self.pop_size = pop_size
         self.generations = generations
         self.mutation_rate = mutation_rate
+        self.vectorized = vectorized    # populacja jako macierz (pop_size x route_len) NumPy
+
+        self.cache_size = cache_size    # pamięć fitness, klucz to spakowany chromosom (LRU)
+        self.fitness_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
         
-        self.cargo_status = self._simulate_cargo_on_route()
+        self.cargo_values, self.cargo_order_ids, self.cargo_actions, loaded_orders = self._simulate_cargo_on_route()
         
-        loaded_orders = {status['order_id'] for status in self.cargo_status if status['order_id'] is not None}
-        orders_dict = {i: o for i, o in enumerate(orders)}
-        self.base_revenue = sum(orders_dict[oid][2] for oid in loaded_orders)
+        self.base_revenue = sum(orders[oid][2] for oid in loaded_orders)
+
+        # Wektory do liczenia fitness całej populacji naraz
+        self.cost_security = np.array([r[2] for r in route_data], dtype=float)
+        self.expected_loss = self.cargo_values * np.array([r[1] for r in route_data], dtype=float)
 
     def _simulate_cargo_on_route(self):
-        """mapowanie gdzie jest ładunek"""
-        cargo_map = []
-        current_order = None
-        pending_orders = [list(o) + [i] for i, o in enumerate(self.orders)]
+        if self.events is not None:
+            return self._simulate_planned_events()
+        return self._simulate_greedy_loading()
+
+    def _simulate_planned_events(self):
+        """ładunek według planu kolonii: kolejne zdarzenie wykonuje się w pierwszym kroku trasy
+        stojącym w jego węźle (tak samo jak opis trasy w GUI), zwraca to samo co _simulate_greedy_loading"""
+        values = np.zeros(self.route_len)
+        order_ids = np.full(self.route_len, -1, dtype=int)
+        actions = np.full(self.route_len, ACTION_EMPTY, dtype=np.int8)
+
+        loaded = {}                             # id zlecenia -> wartość, w kolejności załadunku
+        loaded_orders = []
+        next_event = 0
+        for i, node_info in enumerate(self.route_data):
+            node_id = node_info[0]
+
+            new_orders, unloaded = [], []
+            while next_event < len(self.events):
+                oid, kind = self.events[next_event]
+                start, end, profit = self.orders[oid]
+                if node_id != (start if kind == 'p' else end):
+                    break
+                if kind == 'p':
+                    loaded[oid] = profit
+                    new_orders.append(oid)
+                else:
+                    loaded.pop(oid, None)
+                    unloaded.append(oid)
+                next_event += 1
+            loaded_orders.extend(new_orders)
+
+            if new_orders:
+                actions[i] = ACTION_LOAD
+            elif unloaded:
+                actions[i] = ACTION_UNLOAD
+            elif loaded:
+                actions[i] = ACTION_CARRY       # Transport
+            values[i] = sum(loaded.values())
+            order_ids[i] = new_orders[0] if new_orders else next(iter(loaded), -1)
+        return values, order_ids, actions, loaded_orders
+
+    def _simulate_greedy_loading(self):
+        """mapowanie gdzie jest ładunek: równoległe tablice (wartość, id zlecenia, kod akcji) na każdy krok
+        oraz lista załadowanych zleceń; wartość kroku to suma wszystkich paczek na pokładzie"""
+        values = np.zeros(self.route_len)
+        order_ids = np.full(self.route_len, -1, dtype=int)
+        actions = np.full(self.route_len, ACTION_EMPTY, dtype=np.int8)
+
+        loaded = {}                             # id zlecenia -> (węzeł dostawy, wartość), w kolejności załadunku
+        loaded_orders = []
+        pending_orders = defaultdict(deque)     # węzeł odbioru -> zlecenia czekające w kolejności z listy
+        for i, (start, end, profit) in enumerate(self.orders):
+            pending_orders[start].append((i, end, profit))
         
         for i, node_info in enumerate(self.route_data):
             node_id = node_info[0]
-            step_info = {'value': 0, 'order_id': None, 'action': 'empty'}
             
             # Rozładunek
-            if current_order and current_order[1] == node_id:
-                current_order = None
-                step_info['action'] = 'unload'
-            
-            # Załadunek
-            if current_order is None:
-                found_idx = -1
-                for idx, order in enumerate(pending_orders):
-                    start, end, profit, original_idx = order
-                    if start == node_id:
-                        current_order = (original_idx, end, profit)
-                        found_idx = idx
-                        step_info['action'] = 'load'
-                        step_info['value'] = profit
-                        step_info['order_id'] = original_idx
-                        break
-                if found_idx != -1:
-                    pending_orders.pop(found_idx)
+            unloaded = [oid for oid, (end, _) in loaded.items() if end == node_id]
+            for oid in unloaded:
+                del loaded[oid]
             
-            # Transport
-            elif current_order is not None:
-                step_info['value'] = current_order[2]
-                step_info['order_id'] = current_order[0]
-                step_info['action'] = 'carry'
-            
-            cargo_map.append(step_info)
-        return cargo_map
+            # Załadunek, dopóki jest miejsce
+            new_orders = []
+            waiting = pending_orders.get(node_id)
+            while waiting and len(loaded) < self.capacity:
+                oid, end, profit = waiting.popleft()
+                loaded[oid] = (end, profit)
+                new_orders.append(oid)
+            loaded_orders.extend(new_orders)
+
+            if new_orders:
+                actions[i] = ACTION_LOAD
+            elif unloaded:
+                actions[i] = ACTION_UNLOAD
+            elif loaded:
+                actions[i] = ACTION_CARRY       # Transport
+            values[i] = sum(profit for _, profit in loaded.values())
+            order_ids[i] = new_orders[0] if new_orders else next(iter(loaded), -1)
+        return values, order_ids, actions, loaded_orders
 
     def fitness(self, chromosome):
-        penalty = 0
-        for i in range(self.route_len):
-            _, prob_robbery, cost_security = self.route_data[i]
-            cargo_val = self.cargo_status[i]['value']
-            buy_security = chromosome[i]
-            
-            if buy_security == 1:
-                penalty += cost_security
-            else:
-                expected_loss = cargo_val * prob_robbery
-                penalty += expected_loss
+        buy_security = np.asarray(chromosome, dtype=bool)
+        penalty = self.cost_security[buy_security].sum() + self.expected_loss[~buy_security].sum()
         return self.base_revenue - penalty
 
     def create_individual(self):
@@ -85,15 +138,110 @@ class SingleCargoGA:
                 ind[i] = 1 - ind[i]
         return ind
 
-    def run(self):
+    def cached_fitness(self, chromosome):
+        key = np.packbits(np.asarray(chromosome, dtype=np.uint8)).tobytes()
+        if key in self.fitness_cache:
+            self.cache_hits += 1
+            self.fitness_cache.move_to_end(key)
+            return self.fitness_cache[key]
+
+        self.cache_misses += 1
+        fit = self.fitness(chromosome)
+        self.fitness_cache[key] = fit
+        if len(self.fitness_cache) > self.cache_size:
+            self.fitness_cache.popitem(last=False)      # usuwamy najdawniej używany
+        return fit
+
+    def cache_stats(self):
+        calls = self.cache_hits + self.cache_misses
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'size': len(self.fitness_cache),
+                'hit_rate': self.cache_hits / calls if calls else 0.0}
+
+    def population_fitness(self, population):
+        """fitness wszystkich osobników: kupno ochrony zamienia oczekiwaną stratę na koszt ochrony"""
+        return self.base_revenue - self.expected_loss.sum() - population @ (self.cost_security - self.expected_loss)
+
+    def run_vectorized(self, callback=None, time_limit=None, patience=None):
+        population = np.random.randint(0, 2, size=(self.pop_size, self.route_len), dtype=np.uint8)
+        history_best = []
+
+        best_sol = None
+        best_fit_overall = -float('inf')
+        n_pairs = self.pop_size // 2                  # pary rodziców na pop_size - 1 dzieci
+        genes = np.arange(self.route_len)
+        stop = self._stop_rule(callback, time_limit, patience)
+
+        for _ in range(self.generations):
+            fits = self.population_fitness(population)
+
+            best_idx = int(np.argmax(fits))
+            if fits[best_idx] > best_fit_overall:
+                best_fit_overall = float(fits[best_idx])
+                best_sol = population[best_idx].copy()
+
+            history_best.append(best_fit_overall)
+            if stop(history_best):
+                break
+
+            # Turnieje dwuosobowe dla wszystkich par naraz
+            idx = np.random.randint(0, self.pop_size, size=(n_pairs, 4))
+            f = fits[idx]
+            parent_a = population[np.where(f[:, 0] > f[:, 1], idx[:, 0], idx[:, 1])]
+            parent_b = population[np.where(f[:, 2] > f[:, 3], idx[:, 2], idx[:, 3])]
+
+            # Krzyżowanie jednopunktowe maską
+            pt = np.random.randint(1, self.route_len, size=n_pairs)
+            mask = genes[None, :] < pt[:, None]
+            children = np.empty((2 * n_pairs, self.route_len), dtype=np.uint8)
+            children[0::2] = np.where(mask, parent_a, parent_b)
+            children[1::2] = np.where(mask, parent_b, parent_a)
+            children = children[:self.pop_size - 1]
+
+            # Mutacja
+            children ^= (np.random.random(children.shape) < self.mutation_rate).astype(np.uint8)
+
+            population = np.vstack((best_sol[None, :], children))
+
+        return best_sol.tolist(), history_best
+
+    def run_exact(self):
+        """dokładne optimum: przy znanym ładunku fitness jest sumą niezależnych kroków trasy,
+        więc ochronę opłaca się kupić dokładnie tam, gdzie jest tańsza od oczekiwanej straty"""
+        best_sol = (self.cost_security < self.expected_loss).astype(int).tolist()
+        return best_sol, [self.fitness(best_sol)]
+
+    def _stop_rule(self, callback, time_limit, patience):
+        """kryterium stopu sprawdzane po każdej generacji; powód zostaje w self.stop_reason"""
+        start = time.perf_counter()
+        self.stop_reason = 'generations'
+
+        def stop(history):
+            if callback is not None and callback(history):
+                self.stop_reason = 'callback'
+            elif patience is not None and len(history) > patience and history[-1] <= history[-1 - patience]:
+                self.stop_reason = 'stagnation'             # brak poprawy od patience generacji
+            elif time_limit is not None and time.perf_counter() - start >= time_limit:
+                self.stop_reason = 'deadline'
+            else:
+                return False
+            return True
+        return stop
+
+    def run(self, callback=None, time_limit=None, patience=None):
+        """callback(historia) po każdej generacji, zwrócona prawdziwa wartość kończy ewolucję;
+        time_limit - limit czasu w sekundach, patience - liczba generacji bez poprawy"""
+        if self.vectorized:
+            return self.run_vectorized(callback, time_limit, patience)
+
         population = [self.create_individual() for _ in range(self.pop_size)]
         history_best = []
         
         best_sol = None
         best_fit_overall = -float('inf')
+        stop = self._stop_rule(callback, time_limit, patience)
 
         for _ in range(self.generations):
-            fits = [self.fitness(ind) for ind in population]
+            fits = [self.cached_fitness(ind) for ind in population]
             
             current_max = max(fits)
 
@@ -102,17 +250,19 @@ class SingleCargoGA:
                 best_sol = population[fits.index(current_max)]
             
             history_best.append(best_fit_overall)
-    
+            if stop(history_best):
+                break
             
             new_pop = [best_sol] 
             while len(new_pop) < self.pop_size:
-                p1 = random.choice(population)
-                p2 = random.choice(population)
-                parent_a = p1 if self.fitness(p1) > self.fitness(p2) else p2
+                # Turniej na indeksach - fitness już policzony w fits
+                i1 = random.randrange(self.pop_size)
+                i2 = random.randrange(self.pop_size)
+                parent_a = population[i1] if fits[i1] > fits[i2] else population[i2]
                 
-                p3 = random.choice(population)
-                p4 = random.choice(population)
-                parent_b = p3 if self.fitness(p3) > self.fitness(p4) else p4
+                i3 = random.randrange(self.pop_size)
+                i4 = random.randrange(self.pop_size)
+                parent_b = population[i3] if fits[i3] > fits[i4] else population[i4]
                 
                 c1, c2 = self.crossover(parent_a, parent_b)
                 new_pop.append(self.mutate(c1))
@@ -123,6 +273,129 @@ class SingleCargoGA:
         return best_sol, history_best
 
 
+class CorrelatedCargoGA(SingleCargoGA):
+    """GA dla modelu, którego nie da się rozbić na kroki: ryzyko przechodzi na kolejny odcinek
+    (brak ochrony z ładunkiem mnoży ryzyko następnego kroku przez 1 + risk_carry), budżet jako kara"""
+    def __init__(self, route_data, orders, budget=None, risk_carry=0.0, **kwargs):
+        kwargs['vectorized'] = False                # fitness nieliniowy, tylko tryb listowy
+        super().__init__(route_data, orders, **kwargs)
+        self.budget = budget
+        self.risk_carry = risk_carry
+        # Kara za każdą jednostkę ponad budżet większa niż najlepszy zysk z jednostki ochrony
+        ratios = self.expected_loss[self.cost_security > 0] / self.cost_security[self.cost_security > 0]
+        self.over_budget_penalty = 1 + (1 + risk_carry) * (ratios.max() if len(ratios) else 0)
+
+    def fitness(self, chromosome):
+        penalty = 0
+        spent = 0
+        carry = 1.0
+        for i in range(self.route_len):
+            _, prob_robbery, cost_security = self.route_data[i]
+            cargo_val = self.cargo_values[i]
+
+            if chromosome[i] == 1:
+                penalty += cost_security
+                spent += cost_security
+                carry = 1.0
+            else:
+                penalty += cargo_val * min(1.0, prob_robbery * carry)
+                carry = 1 + self.risk_carry if cargo_val > 0 else 1.0
+
+        if self.budget is not None and spent > self.budget:
+            penalty += (spent - self.budget) * self.over_budget_penalty
+        return self.base_revenue - penalty
+
+
+class ProtectionPlanner:
+    """wybór ochrony dla trasy z compute_path przy dziennym budżecie:
+    bez budżetu - dokładne optimum, z budżetem - plecak (DP albo relaksacja Lagrange'a),
+    ryzyko przenoszone między odcinkami - GA"""
+    def __init__(self, route_data, orders, budget=None, risk_carry=0.0, dp_limit=20_000_000,
+                 pop_size=100, generations=200, mutation_rate=0.05, capacity=1, events=None):
+        self.route_data = route_data
+        self.orders = orders
+        self.budget = budget
+        self.risk_carry = risk_carry
+        self.dp_limit = dp_limit                    # maks. rozmiar tablicy DP (kroki x budżet)
+        self.ga_params = {'pop_size': pop_size, 'generations': generations, 'mutation_rate': mutation_rate,
+                          'capacity': capacity, 'events': events}
+
+        self.ga = SingleCargoGA(route_data, orders, **self.ga_params)
+        self.method = None                          # ostatnio użyta metoda
+
+    def run(self, callback=None, time_limit=None, patience=None):
+        if self.risk_carry > 0:
+            self.method = 'ga'
+            ga = CorrelatedCargoGA(self.route_data, self.orders, budget=self.budget,
+                                   risk_carry=self.risk_carry, **self.ga_params)
+            return ga.run(callback, time_limit, patience)
+
+        saving = self.ga.expected_loss - self.ga.cost_security
+        items = np.flatnonzero(saving > 0)          # tylko kroki, na których ochrona się opłaca
+        if self.budget is None or self.ga.cost_security[items].sum() <= self.budget:
+            self.method = 'exact'
+            return self.ga.run_exact()
+
+        weights = np.ceil(self.ga.cost_security[items]).astype(int)
+        if len(items) * (int(self.budget) + 1) <= self.dp_limit:
+            self.method = 'dp'
+            chosen = self._knapsack_dp(weights, saving[items], int(self.budget))
+        else:
+            self.method = 'lagrange'
+            chosen = self._lagrangian(weights, saving[items], self.budget)
+
+        best_sol = [0] * len(self.route_data)
+        for i in items[chosen]:
+            best_sol[i] = 1
+        return best_sol, [self.ga.fitness(best_sol)]
+
+    def _knapsack_dp(self, weights, values, capacity):
+        best = np.zeros(capacity + 1)               # best[c] - największa oszczędność przy wydatku <= c
+        take = np.zeros((len(weights), capacity + 1), dtype=bool)
+        for n, (w, v) in enumerate(zip(weights, values)):
+            if w > capacity:
+                continue
+            with_item = best[:capacity + 1 - w] + v
+            better = with_item > best[w:]
+            take[n, w:] = better
+            best[w:] = np.where(better, with_item, best[w:])
+
+        chosen = np.zeros(len(weights), dtype=bool)
+        c = capacity
+        for n in range(len(weights) - 1, -1, -1):
+            if take[n, c]:
+                chosen[n] = True
+                c -= weights[n]
+        return chosen
+
+    def _lagrangian(self, weights, values, capacity, iterations=100):
+        # Relaksacja: max sum(v*x) - lambda * (sum(w*x) - budżet), dla danego lambda krok wchodzi, gdy v - lambda*w > 0.
+        # Bisekcja szuka najmniejszego lambda, przy którym wybór mieści się w budżecie, potem naprawa:
+        # nadmiar usuwamy od najgorszego ilorazu v/w, resztę budżetu dopełniamy od najlepszego
+        weights = weights.astype(float)
+        ratio = values / np.maximum(weights, 1e-9)
+        lo, hi = 0.0, float(ratio.max())            # przy lambda = max(v/w) nic się nie opłaca
+        for _ in range(iterations):
+            lam = (lo + hi) / 2
+            if weights[values - lam * weights > 0].sum() > capacity:
+                lo = lam
+            else:
+                hi = lam
+        chosen = values - hi * weights > 0
+
+        spent = weights[chosen].sum()
+        for n in np.argsort(ratio):
+            if spent <= capacity:
+                break
+            if chosen[n]:
+                chosen[n] = False
+                spent -= weights[n]
+        for n in np.argsort(-ratio):
+            if not chosen[n] and weights[n] <= capacity - spent:
+                chosen[n] = True
+                spent += weights[n]
+        return chosen
+
 
 if __name__ == "__main__":
     
@@ -130,6 +403,12 @@ if __name__ == "__main__":
     parser.add_argument('--pop_size', type=int, default=50, help='Rozmiar populacji')
     parser.add_argument('--gen', type=int, default=100, help='Liczba generacji')
     parser.add_argument('--mut', type=float, default=0.05, help='Szansa mutacji')
+    parser.add_argument('--vectorized', action='store_true', help='Populacja jako macierz NumPy')
+    parser.add_argument('--budget', type=float, default=None, help='Dzienny budżet na ochronę')
+    parser.add_argument('--risk_carry', type=float, default=0.0, help='Wzrost ryzyka po odcinku bez ochrony')
+    parser.add_argument('--capacity', type=int, default=1, help='Ile paczek kurier wiezie naraz')
+    parser.add_argument('--time_limit', type=float, default=None, help='Limit czasu GA w sekundach')
+    parser.add_argument('--patience', type=int, default=None, help='Stop po tylu generacjach bez poprawy')
     
     args = parser.parse_args()
 
@@ -169,15 +448,28 @@ if __name__ == "__main__":
     ]
     
     ga = SingleCargoGA(trasa_input, zamowienia_input, 
-                       pop_size=args.pop_size, generations=args.gen, mutation_rate=args.mut)
+                       pop_size=args.pop_size, generations=args.gen, mutation_rate=args.mut,
+                       vectorized=args.vectorized, capacity=args.capacity)
     
-    best_chromosome, fit_history = ga.run()
+    best_chromosome, fit_history = ga.run(time_limit=args.time_limit, patience=args.patience)
     best_score = fit_history[-1]
+    _, exact_history = ga.run_exact()
     print(best_chromosome)
     # Wyświetlanie tabeli wyników
     print(f"\nStart z parametrami: Populacja={args.pop_size}, Generacje={args.gen}, Mutacja={args.mut}")
     print(f"Maksymalny możliwy przychód: {ga.base_revenue}")
-    print(f"Osiągnięty zysk netto: {best_score:.2f}")
+    print(f"Osiągnięty zysk netto: {best_score:.2f} (stop: {ga.stop_reason} po {len(fit_history)} generacjach)")
+    print(f"Dokładne optimum (bez GA): {exact_history[-1]:.2f}")
+    if args.budget is not None or args.risk_carry > 0:
+        planner = ProtectionPlanner(trasa_input, zamowienia_input, budget=args.budget, risk_carry=args.risk_carry,
+                                    pop_size=args.pop_size, generations=args.gen, mutation_rate=args.mut,
+                                    capacity=args.capacity)
+        planned, planned_history = planner.run()
+        spent = sum(trasa_input[i][2] for i, gene in enumerate(planned) if gene)
+        print(f"Plan z budżetem ({planner.method}): zysk {planned_history[-1]:.2f}, wydano {spent} z {args.budget}")
+    if not args.vectorized:
+        stats = ga.cache_stats()
+        print(f"Pamięć fitness: trafienia {stats['hits']}, chybienia {stats['misses']} ({stats['hit_rate']:.1%})")
     
     print("\n" + "-"*65)
     print(f"{'Węzeł':<6} | {'Status':<8} | {'Ładunek':<8} | {'Ochrona':<8} | {'Decyzja'}")
@@ -188,7 +480,7 @@ if __name__ == "__main__":
         node_id = trasa_input[i][0]
         prob = trasa_input[i][1]
         cost = trasa_input[i][2]
-        val = ga.cargo_status[i]['value']
+        val = ga.cargo_values[i]
         
         decyzja = "TAK" if gene else "NIE"
         ryzyko = val * prob
@@ -203,7 +495,7 @@ if __name__ == "__main__":
             if cost > ryzyko: info = "Oszczędność"
             else: info = "Ryzykowna!"
 
-        print(f"ID: {node_id:<2} | {ga.cargo_status[i]['action']:<8} | {val:<8} | {decyzja:<8} | {info}")
+        print(f"ID: {node_id:<2} | {ACTION_NAMES[ga.cargo_actions[i]]:<8} | {val:<8g} | {decyzja:<8} | {info}")
         
     plt.figure(figsize=(10, 6))
     plt.plot(range(len(fit_history)), fit_history, label='Najlepszy wynik (Best-so-far)', color='red', linewidth=2)
@@ -1,7 +1,17 @@
+import argparse
+import functools
+import heapq
+import time
 import numpy as np
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
 
 class AntColonyOptimization:
-    def __init__(self, dist_matrix, orders, base_node, params):
+    def __init__(self, dist_matrix, orders, base_node, params, backend="numpy", construction="sequential",
+                 candidates=None, segment_cache=4096, shortest_paths=None, local_search=False,
+                 objective="distance", risk_matrix=None, protection_cost=None, distance_cost=1.0, legs=None,
+                 capacity=1, pheromone_rule="elitist", p_best=0.05, should_stop=None):
         #Params
         self.iterations = params[0] # Number of iterations
         self.ants       = params[1] # Number of ants
@@ -10,18 +20,115 @@ class AntColonyOptimization:
         self.rho        = params[4] # Evaporation rate
 
         self.base_node = base_node            # Base set
-        self.orders = orders                  # List of orders
-        self.cities = dist_matrix.shape[0]    # Number of cities
+        self.orders = list(orders)            # List of orders, own copy (caller may keep editing its list)
+        self.construction = construction      # "sequential" (ant by ant) or "batched" (all ants in lockstep)
+        self.cities = len(dist_matrix)        # Number of cities
+        self.terminals = np.arange(self.cities)  # Matrix row -> city, identity for dense backends
+        self.predecessors = None              # Shortest path trees, only for sparse backend
         
         # Initialize the distance matrix by calculating shortest paths between all nodes
-        self.dist_matrix, self.next_node = self._floyd_warshall_with_path(dist_matrix)
+        if shortest_paths is not None:
+            # Already computed (dist_matrix, next_node, predecessors, terminals), e.g. shared between colonies
+            self.dist_matrix, self.next_node, self.predecessors, self.terminals = shortest_paths
+        elif backend == "numpy":
+            self.dist_matrix, self.next_node = self._floyd_warshall_numpy(dist_matrix)
+        elif backend == "loop":
+            self.dist_matrix, self.next_node = self._floyd_warshall_with_path(dist_matrix)
+        elif backend == "dijkstra":
+            self.dist_matrix, self.predecessors = self._dijkstra_from_terminals(dist_matrix)
+            self.next_node = None
+        else:
+            raise ValueError(f"Unknown shortest path backend: {backend}")
+
+        if self.predecessors is not None:
+            # Only base, pickup and delivery nodes get rows: orders and base are remapped to row indices
+            row_of = {int(city): row for row, city in enumerate(self.terminals)}
+            self.base_node = row_of[base_node]
+            self.orders = [(row_of[p], row_of[d], val) for p, d, val in orders]
 
-        self.pheromone = np.ones((self.cities, self.cities)) * 0.1          # Initializing pheromones
-        
         self.history_best_dist = []                                         # List using to show how distance decrease in every iteration
         self.global_best_path = None                                        # Shortest path
         self.global_best_dist = float('inf')                                # Distance the shortest path
         self.orders_sequence_history = None                               # Best sequence of order indices
+        self._segment_path = functools.lru_cache(maxsize=segment_cache)(self._segment)  # (u, v) -> tuple(path)
+
+        # Cost of a tour: distance_cost * empty driving + cost of every pickup -> delivery leg
+        self.objective = objective                                          # "distance" or "profit" (distance + protection)
+        self.revenue = sum(o[2] for o in self.orders)                       # Net profit of a tour = revenue - its cost
+        if objective == "distance":
+            self.distance_cost = 1.0
+            self.leg_cost = np.array([self.dist_matrix[p, d] for p, d, _ in self.orders], dtype=float)
+            self.leg_paths = None                                           # Legs follow shortest paths
+        elif objective == "profit":
+            self.distance_cost = distance_cost                              # Money per km
+            if legs is None:
+                legs = self._safe_legs(dist_matrix, risk_matrix, protection_cost, should_stop)
+            self.leg_cost, self.leg_paths = legs
+        else:
+            raise ValueError(f"Unknown objective: {objective}")
+
+        self.local_search = local_search                                    # 2-opt / Or-opt / swap on elite ants
+        self._init_order_cost()
+
+        # Capacity > 1: ant interleaves pickups and deliveries, tour is a sequence of events
+        # (event o < len(orders) picks order o up, event len(orders) + o delivers it)
+        self.capacity = capacity                                            # Parcels carried at once
+        if capacity > 1:
+            if objective != "distance" or local_search or candidates is not None:
+                raise ValueError("Capacity > 1 supports only the distance objective without local search and candidates")
+            self.event_nodes = np.array([o[0] for o in self.orders] + [o[1] for o in self.orders], dtype=int)
+
+        # Pheromone lives on the order graph, not on the map: trail a -> b means "order b right after order a"
+        # (events with capacity > 1), the base is the last, virtual order. Memory scales with orders, not cities
+        slots = len(self._slot_nodes()[0])
+        self.pheromone = np.ones((slots, slots)) * 0.1                      # Initializing pheromones
+        self._init_choice_info()                                            # Cached eta^beta, tau^alpha and their product
+
+        # "elitist": top 25% of ants deposit without bounds
+        # "mmas": MAX-MIN Ant System, one ant deposits, trails clipped to [tau_min, tau_max], restart on stagnation
+        if pheromone_rule not in ("elitist", "mmas"):
+            raise ValueError(f"Unknown pheromone rule: {pheromone_rule}")
+        self.pheromone_rule = pheromone_rule
+        self.p_best = p_best                                                # Chance to rebuild the best tour once converged
+        self.mmas_lambda = 0.05                                             # lambda of the lambda-branching factor
+        self.mmas_branching = 1.05                                          # Branching within 5% of a converged trail -> restart
+        self.tau_min = self.tau_max = None                                  # Bounds, follow the best tour length
+        self.mmas_iteration = 0                                             # Iterations since the last (re)initialization
+        self.mmas_restarts = 0                                              # Pheromone reinitializations so far
+
+        self.candidates = candidates                                        # k nearest pickups per node, None = all orders
+        self.candidate_steps = 0                                            # Decisions made with candidate lists
+        self.candidate_fallbacks = 0                                        # Decisions where all candidates were used up
+        if candidates is not None:
+            self._build_candidate_lists(candidates)
+
+    def _build_candidate_lists(self, k):
+        pickups = np.array([o[0] for o in self.orders], dtype=int)
+        pickup_nodes, order_pickup = np.unique(pickups, return_inverse=True)
+        sources = np.unique([self.base_node] + [o[1] for o in self.orders])     # Ant decides only in base and delivery nodes
+
+        self.candidate_row = np.full(self.dist_matrix.shape[0], -1)            # Node -> row in candidate_mask
+        self.candidate_row[sources] = np.arange(len(sources))
+
+        nearest = np.ones((len(sources), len(pickup_nodes)), dtype=bool)
+        if k < len(pickup_nodes):
+            dist = self.dist_matrix[sources[:, None], pickup_nodes[None, :]]
+            closest = np.argpartition(dist, k - 1, axis=1)[:, :k]            # k nearest pickup nodes, unordered
+            nearest[:] = False
+            nearest[np.arange(len(sources))[:, None], closest] = True
+        self.candidate_mask = nearest[:, order_pickup]                          # (sources x orders) candidate orders
+
+    def decode_events(self, events):
+        # Event sequence -> [(order index, "p" or "d"), ...]
+        n_orders = len(self.orders)
+        return [(e % n_orders, "p" if e < n_orders else "d") for e in events]
+
+    def net_profit(self):
+        # Revenue of all orders minus the cost of the best tour; revenue is fixed, so the cheapest tour is the most profitable
+        return self.revenue - self.global_best_dist
+
+    def candidate_fallback_rate(self):
+        return self.candidate_fallbacks / self.candidate_steps if self.candidate_steps else 0.0
 
     def _floyd_warshall_with_path(self, matrix):
         n = self.cities                                    # Number cities
@@ -47,7 +154,105 @@ class AntColonyOptimization:
         dist[dist == float('inf')] = 1e9 # Change inf to vary big number
         return dist, next_node
 
+    def _floyd_warshall_numpy(self, matrix):
+        return _floyd_warshall_arrays(_edge_weights(matrix))
+
+    def _adjacency_list(self, graph):
+        if not isinstance(graph, np.ndarray):
+            return graph                                                   # Already list: node -> [(neighbor, weight), ...]
+
+        if graph.dtype == object:
+            connected = ~np.equal(graph, None)
+        else:
+            connected = np.isfinite(graph.astype(float))
+        np.fill_diagonal(connected, False)
+
+        adjacency = [[] for _ in range(len(graph))]
+        for u, v in zip(*np.nonzero(connected)):
+            adjacency[u].append((int(v), float(graph[u, v])))
+        return adjacency
+
+    def _dijkstra_from_terminals(self, graph):
+        adjacency = self._adjacency_list(graph)
+        n = len(adjacency)
+
+        terminals = {self.base_node}
+        for p_node, d_node, _ in self.orders:
+            terminals.update((p_node, d_node))
+        self.terminals = np.array(sorted(terminals), dtype=int)
+        t = len(self.terminals)
+
+        dist = np.full((t, t), 1e9)                                        # Compact terminal x terminal matrix
+        predecessors = np.full((t, n), -1, dtype=np.int32)                 # One shortest path tree per terminal
+
+        for row, source in enumerate(self.terminals):
+            best = [float('inf')] * n
+            pred = predecessors[row]
+            best[source] = 0.0
+            heap = [(0.0, int(source))]
+            to_settle = set(terminals)                                     # Stop when every terminal is settled
+
+            while heap and to_settle:
+                d_u, u = heapq.heappop(heap)
+                if d_u > best[u]:
+                    continue                                               # Outdated heap entry
+                to_settle.discard(u)
+                for v, w in adjacency[u]:
+                    d_v = d_u + w
+                    if d_v < best[v]:
+                        best[v] = d_v
+                        pred[v] = u
+                        heapq.heappush(heap, (d_v, v))
+
+            for col, target in enumerate(self.terminals):
+                if best[target] < float('inf'):
+                    dist[row, col] = best[target]
+        return dist, predecessors
+
+    def _safe_legs(self, graph, risk_graph, protection_cost, should_stop=None):
+        # Loaded leg of order with value v: every step u -> w costs distance_cost * km + min(protection of u, v * risk),
+        # protection is bought exactly where it is cheaper than the expected loss, so a longer safer path can win.
+        # should_stop() is asked before every order; once it says True the remaining legs stay forbidden
+        adjacency = self._adjacency_list(graph)
+        risk_of = [dict(neighbours) for neighbours in self._adjacency_list(risk_graph)]
+        leg_cost = np.full(len(self.orders), 1e9)
+        leg_paths = []
+
+        for o_idx, (p_node, d_node, value) in enumerate(self.orders):
+            source, target = int(self.terminals[p_node]), int(self.terminals[d_node])
+            if should_stop is not None and should_stop():
+                leg_paths.append((source, target))                          # Cancelled, not computed
+                continue
+            best = {source: 0.0}
+            pred = {}
+            heap = [(0.0, source)]
+            while heap:
+                c_u, u = heapq.heappop(heap)
+                if u == target:
+                    break
+                if c_u > best[u]:
+                    continue                                               # Outdated heap entry
+                for v, w in adjacency[u]:
+                    c_v = c_u + self.distance_cost * w + min(protection_cost[u], value * risk_of[u].get(v, 0.0))
+                    if c_v < best.get(v, float('inf')):
+                        best[v] = c_v
+                        pred[v] = u
+                        heapq.heappush(heap, (c_v, v))
+
+            if target not in best:
+                leg_paths.append((source, target))                          # Forbidden connection
+                continue
+            path = [target]
+            while path[-1] != source:
+                path.append(pred[path[-1]])
+            leg_cost[o_idx] = best[target]
+            leg_paths.append(tuple(path[::-1]))
+        return leg_cost, leg_paths
+
     def _get_full_path_(self, u, v):
+        if self.next_node is None:
+            return self._get_tree_path(u, v)
+
         if self.next_node[u][v] == -1: 
             return [u, v]
         
@@ -62,75 +267,331 @@ class AntColonyOptimization:
             full_path.append(temp_u)
         return full_path
 
-    def _get_move_probability(self, current_node, allowed_nodes):
-        probabilities = []
-        for next_node in allowed_nodes:
-            # We check pheromone between current node and the target pickup node
-            p_val = self.pheromone[current_node, next_node]                             # Pheromon value
-            d_val = self.dist_matrix[current_node, next_node]                           # Distance value
-            
-            if d_val >= 1e9:                                                            # Security for forbidden connection
-                probabilities.append(0)
-                continue
+    def _get_tree_path(self, u, v):
+        source, target = self.terminals[u], self.terminals[v]
+        pred = self.predecessors[u]                     # Tree of shortest paths from u
+
+        if source == target or pred[target] == -1:
+            return [source, target]
+
+        # We walk back from target to source and reverse
+        reversed_path = [target]
+        while reversed_path[-1] != source:
+            reversed_path.append(pred[reversed_path[-1]])
+        return reversed_path[::-1]
+
+    def _slot_nodes(self):
+        # Node where every order (event) of the order graph starts and ends, base is the last slot
+        if self.capacity > 1:
+            starts = ends = np.append(self.event_nodes, self.base_node)
+        else:
+            starts = np.array([o[0] for o in self.orders] + [self.base_node], dtype=int)
+            ends = np.array([o[1] for o in self.orders] + [self.base_node], dtype=int)
+        return starts, ends
+
+    def _init_choice_info(self):
+        # Distances never change during solve(), so the heuristic part is computed once
+        starts, ends = self._slot_nodes()
+        empty_dist = self.dist_matrix[ends[:, None], starts[None, :]]           # End of a -> start of b
+        self.eta_beta = (1.0 / (empty_dist + 1e-6)) ** self.beta                # Heuristic desirability
+        self.eta_beta[empty_dist >= 1e9] = 0                                    # Security for forbidden connection
+        self._update_choice_info()
 
-            tau = p_val ** self.alpha                                                   # Pheromone trail intensity
-            # Raising (1/dist) to the power of Beta can create very small numbers; we cap it for stability
-            eta = (1.0 / (d_val + 1e-6)) ** self.beta                                   # Heuristic desirability 
-            probabilities.append(tau * eta)                                             # Product of tau end eta
+    def _update_choice_info(self):
+        self.tau_alpha = self.pheromone ** self.alpha                           # Pheromone trail intensity
+        self.choice_info = self.tau_alpha * self.eta_beta                       # Product of tau and eta for every edge
+
+    def _get_move_probability(self, current_slot, allowed_slots):
+        probabilities = self.choice_info[current_slot, allowed_slots]                   # Row gather, no powers in the hot path
         
-        total = sum(probabilities)                                                      # Sum of probabilities
+        total = probabilities.sum()                                                     # Sum of probabilities
         if total <= 1e-12:                                                              # If all paths have zero probability or underflow
-            return [1.0 / len(allowed_nodes)] * len(allowed_nodes)                      # Random choose 
+            return [1.0 / len(allowed_slots)] * len(allowed_slots)                      # Random choose 
             
-        return [p / total for p in probabilities]                                       # Normalize values for probabilities
+        return probabilities / total                                                    # Normalize values for probabilities
 
-    def solve(self):
+    def solve(self, callback=None, time_limit=None, patience=None):
+        # callback(history_best_dist) after every iteration, a true result stops the colony.
+        # time_limit: wall-clock seconds, patience: iterations without a new global best.
+        # Why the colony stopped is left in stop_reason
+        self._init_choice_info()
+        start = time.perf_counter()
+        stale = 0                                                                       # Iterations since the last new best
+        self.stop_reason = "iterations"
         for _ in range(self.iterations):
-            all_paths = []                                                              # List with all paths in history
             all_distances = []                                                          # List with distances in every path
             iteration_order_sequences = []                                              # Order sequences in current iteration
             
-            for _ in range(self.ants):
-                path, dist, order_indices = self._run_ant()                             # Start simulation with all ants
-                all_paths.append(path)                                                  # Save path
-                all_distances.append(dist)                                              # Save distance
-                iteration_order_sequences.append(order_indices)
-                
-                if dist < self.global_best_dist:                                        # Chosse the shortest path
-                    self.global_best_dist = dist
-                    self.global_best_path = path
-                    self.orders_sequence_history = order_indices                       # Save best order sequence
+            if self.construction == "batched":
+                run_colony = self._run_colony if self.capacity == 1 else self._run_colony_capacity
+                all_distances, iteration_order_sequences = run_colony()                 # All ants at once
+            else:
+                run_ant = self._run_ant if self.capacity == 1 else self._run_ant_capacity
+                for _ in range(self.ants):
+                    dist, order_indices = run_ant()                                     # Start simulation with all ants
+                    all_distances.append(dist)                                          # Save distance
+                    iteration_order_sequences.append(order_indices)
+
+            if self.local_search:                                                       # Improve elite ants before deposit
+                all_distances = list(all_distances)
+                k = min(max(1, self.ants // 4), len(all_distances))
+                for ant in np.argpartition(all_distances, k - 1)[:k]:
+                    iteration_order_sequences[ant], all_distances[ant] = self._local_search(iteration_order_sequences[ant])
+
+            best_ant = int(np.argmin(all_distances))
+            stale += 1
+            if all_distances[best_ant] < self.global_best_dist:                         # Chosse the shortest path
+                self.global_best_dist = all_distances[best_ant]
+                best_seq = iteration_order_sequences[best_ant]
+                if isinstance(best_seq, np.ndarray):                                    # Row of the batched colony
+                    best_seq = best_seq.tolist()
+                self.orders_sequence_history = best_seq                                 # Save best order sequence
+                self.global_best_path = self._build_path(self.orders_sequence_history) # Full path only for a new best
+                stale = 0
             
             self.history_best_dist.append(min(all_distances))                           # Save the smallest distance in every iteration
+            if callback is not None and callback(self.history_best_dist):
+                self.stop_reason = "callback"
+                break
+            if patience is not None and stale >= patience:
+                self.stop_reason = "stagnation"
+                break
+            if time_limit is not None and time.perf_counter() - start >= time_limit:
+                self.stop_reason = "deadline"
+                break
             
             # PHEROMONE UPDATE LOGIC
-            self.pheromone *= (1 - self.rho)                                            # Pheromone evaporation
-            
-            # ELITIST STRATEGY: Only the top ants reinforce the paths to reduce noise
-            combined = list(zip(all_distances, iteration_order_sequences))
-            combined.sort(key=lambda x: x[0])  # Sort by distance (ascending)
-            
-            for dist, order_seq in combined[:max(1, self.ants // 4)]:                   # Update for top 25% of ants
-                if 0 < dist < 1e9:
-                    pheromone_value = 100.0 / dist                                      # Q=100 scaling factor
-                    
-                    curr = self.base_node
-                    for o_idx in order_seq:
-                        p_node, d_node, _ = self.orders[o_idx]
-                        
-                        # Reinforce the decision points: current -> pickup AND pickup -> delivery
-                        self.pheromone[curr, p_node] += pheromone_value
-                        self.pheromone[p_node, d_node] += pheromone_value
-                        curr = d_node
-                    
-                    # Reinforce the return to base
-                    self.pheromone[curr, self.base_node] += pheromone_value
+            if self.pheromone_rule == "mmas":
+                self._mmas_update(all_distances[best_ant], iteration_order_sequences[best_ant])
+            else:
+                self.pheromone *= (1 - self.rho)                                        # Pheromone evaporation, in place
+
+                # ELITIST STRATEGY: Only the top ants reinforce the paths to reduce noise
+                distances = np.asarray(all_distances, dtype=float)
+                k = min(max(1, self.ants // 4), len(distances))                         # Update for top 25% of ants
+                elite = np.argpartition(distances, k - 1)[:k]                           # Top k unordered, no full sort
+                elite = elite[(distances[elite] > 0) & (distances[elite] < 1e9)]
+                self._deposit_many([iteration_order_sequences[ant] for ant in elite],
+                                   100.0 / distances[elite])                            # Q=100 scaling factor
+
+            self._update_choice_info()                                                  # Refresh tau^alpha once per iteration
                         
         return self.global_best_path, self.global_best_dist, self.history_best_dist, self.orders_sequence_history
 
+    def _init_order_cost(self):
+        # Order level view of a tour: base is virtual order number len(orders)
+        starts = np.array([o[0] for o in self.orders] + [self.base_node], dtype=int)
+        ends = np.array([o[1] for o in self.orders] + [self.base_node], dtype=int)
+        self.order_cost = self.distance_cost * self.dist_matrix[ends[:, None], starts[None, :]]  # End of a -> start of b
+        self.service_dist = self.leg_cost.sum()                                 # Pickup -> delivery legs never change
+
+    def _local_search(self, order_seq):
+        C = self.order_cost
+        base = len(self.orders)
+        m = len(order_seq)
+        tour = np.array([base] + list(order_seq) + [base], dtype=int)
+
+        for _ in range(10 * m if m >= 2 else 0):                                # Best improvement, bounded number of moves
+            best_delta, best_move = -1e-9, None
+            t = tour
+            links = C[t[:-1], t[1:]]                                            # Cost of every link of the tour
+
+            # 2-opt: reverse t[i..j], inner links change direction, prefix sums keep every move O(1)
+            fwd = np.concatenate(([0.0], np.cumsum(links)))
+            rev = np.concatenate(([0.0], np.cumsum(C[t[1:], t[:-1]])))
+            i, j = np.triu_indices(m, 1)
+            i, j = i + 1, j + 1
+            delta = (C[t[i - 1], t[j]] + C[t[i], t[j + 1]] - links[i - 1] - links[j]
+                     + (rev[j] - rev[i]) - (fwd[j] - fwd[i]))
+            k = int(np.argmin(delta))
+            if delta[k] < best_delta:
+                best_delta, best_move = delta[k], ("2-opt", i[k], j[k])
+
+            # Or-opt: move block t[i..i+l-1] between t[k] and t[k+1]
+            for l in range(1, min(3, m - 1) + 1):
+                i = np.arange(1, m - l + 2)[:, None]
+                k = np.arange(0, m + 1)[None, :]
+                delta = (C[t[i - 1], t[i + l]] - links[i - 1] - links[i + l - 1]
+                         + C[t[k], t[i]] + C[t[i + l - 1], t[k + 1]] - links[k])
+                delta = np.where((k >= i - 1) & (k <= i + l - 1), np.inf, delta)   # Block stays in place
+                a, b = np.unravel_index(np.argmin(delta), delta.shape)
+                if delta[a, b] < best_delta:
+                    best_delta, best_move = delta[a, b], ("or-opt", a + 1, b, l)
+
+            # Swap: exchange orders t[i] and t[j]
+            i, j = np.triu_indices(m, 1)
+            i, j = i + 1, j + 1
+            apart = (C[t[i - 1], t[j]] + C[t[j], t[i + 1]] + C[t[j - 1], t[i]] + C[t[i], t[j + 1]]
+                     - links[i - 1] - links[i] - links[j - 1] - links[j])
+            adjacent = (C[t[i - 1], t[j]] + C[t[j], t[i]] + C[t[i], t[j + 1]]
+                        - links[i - 1] - links[i] - links[j])
+            delta = np.where(j == i + 1, adjacent, apart)
+            k = int(np.argmin(delta))
+            if delta[k] < best_delta:
+                best_delta, best_move = delta[k], ("swap", i[k], j[k])
+
+            if best_move is None:                                               # Local optimum
+                break
+            if best_move[0] == "2-opt":
+                _, i, j = best_move
+                tour[i:j + 1] = tour[i:j + 1][::-1].copy()
+            elif best_move[0] == "or-opt":
+                _, i, k, l = best_move
+                block = tour[i:i + l].copy()
+                rest = np.concatenate((tour[:i], tour[i + l:]))
+                at = k + 1 if k < i else k + 1 - l
+                tour = np.concatenate((rest[:at], block, rest[at:]))
+            else:
+                _, i, j = best_move
+                tour[i], tour[j] = tour[j], tour[i]
+
+        return tour[1:-1].tolist(), self.service_dist + C[tour[:-1], tour[1:]].sum()
+
+    def _tour_edges(self, order_seq):
+        # (from, to) slot arrays of every move a tour reinforces, from the base and back to it
+        base = self.pheromone.shape[0] - 1
+        slots = np.concatenate(([base], order_seq, [base])).astype(int)
+        return slots[:-1], slots[1:]
+
+    def _deposit(self, order_seq, pheromone_value):
+        np.add.at(self.pheromone, self._tour_edges(order_seq), pheromone_value)   # Repeated moves add up
+
+    def _deposit_many(self, sequences, pheromone_values):
+        # Every tour in one scatter-add: edges of all tours concatenated, each carries the value of its tour
+        edges = [self._tour_edges(order_seq) for order_seq in sequences]
+        lengths = [len(rows) for rows, _ in edges]
+        if not sum(lengths):
+            return
+        rows = np.concatenate([rows for rows, _ in edges])
+        cols = np.concatenate([cols for _, cols in edges])
+        np.add.at(self.pheromone, (rows, cols), np.repeat(pheromone_values, lengths))
+
+    def _mmas_update(self, iteration_dist, iteration_seq):
+        # MAX-MIN Ant System (Stützle & Hoos): a single ant deposits, every trail stays in [tau_min, tau_max]
+        if not 0 < self.global_best_dist < 1e9:                             # No feasible tour yet, nothing to bound by
+            self.pheromone *= (1 - self.rho)
+            return
+
+        self._mmas_bounds()
+        if self.mmas_iteration == 0:
+            self.pheromone.fill(self.tau_max)                               # Start (or restart) from the upper bound
+        self.pheromone *= (1 - self.rho)
+
+        if self._mmas_best_so_far_turn():
+            dist, order_seq = self.global_best_dist, self.orders_sequence_history
+        else:
+            dist, order_seq = iteration_dist, iteration_seq
+        if 0 < dist < 1e9:
+            self._deposit(order_seq, 100.0 / dist)
+        np.clip(self.pheromone, self.tau_min, self.tau_max, out=self.pheromone)
+        self.mmas_iteration += 1
+
+        if self.branching_factor() <= self.mmas_branching * self._converged_branching():  # Converged, explore again
+            self.pheromone.fill(self.tau_max)
+            self.mmas_iteration = 0
+            self.mmas_restarts += 1
+
+    def _mmas_bounds(self):
+        # tau_max = Q / (rho * best), tau_min so that a converged colony rebuilds the best tour with chance p_best
+        decisions = max(len(self.orders) * (2 if self.capacity > 1 else 1), 2)
+        self.tau_max = 100.0 / (self.rho * self.global_best_dist)
+        p_dec = self.p_best ** (1.0 / decisions)                            # Chance of the best move at each decision
+        avg_choices = max(decisions / 2.0, 2.0)                             # Moves still open, on average
+        self.tau_min = min(self.tau_max * (1 - p_dec) / ((avg_choices - 1) * p_dec), self.tau_max)
+
+    def _mmas_best_so_far_turn(self):
+        # Iteration-best explores first, best-so-far deposits more and more often
+        t = self.mmas_iteration
+        if t < 25:
+            return False
+        for until, every in ((75, 5), (125, 3), (250, 2)):
+            if t < until:
+                return t % every == 0
+        return True
+
+    def _lambda_branching(self, tau, low, high):
+        # Mean over rows of trails above low + lambda * (high - low)
+        return float((tau >= low + self.mmas_lambda * (high - low)).sum(axis=1).mean())
+
+    def branching_factor(self):
+        # Measured against the MMAS bounds, against the row min / max without them
+        tau = self.pheromone
+        if self.tau_max is None:
+            return self._lambda_branching(tau, tau.min(axis=1, keepdims=True), tau.max(axis=1, keepdims=True))
+        return self._lambda_branching(tau, self.tau_min, self.tau_max)
+
+    def _converged_branching(self):
+        # Branching of a trail holding only the best tour; 1 for one route, a fleet leaves the base several times
+        trail = np.zeros(self.pheromone.shape)
+        trail[self._tour_edges(self.orders_sequence_history)] = 1.0
+        return self._lambda_branching(trail, 0.0, 1.0)
+
+    def accept_immigrant(self, order_seq, dist):
+        # Island model migration: best tour of a neighbour colony reinforces this colony
+        if 0 < dist < 1e9:
+            self._deposit(order_seq, 100.0 / dist)
+        if dist < self.global_best_dist:
+            self.global_best_dist = dist
+            self.orders_sequence_history = list(order_seq)
+            self.global_best_path = self._build_path(self.orders_sequence_history)
+
+    def warm_start(self, orders, iterations=10, callback=None, time_limit=None, patience=None):
+        # Same graph, edited order list: matrices and pheromone stay, colony continues from the previous best
+        if self.capacity > 1 or self.objective != "distance":
+            raise ValueError("Warm start supports only the distance objective with capacity 1")
+        if self.predecessors is not None:                                   # Rows exist only for old terminals
+            row_of = {int(city): row for row, city in enumerate(self.terminals)}
+            if any(p not in row_of or d not in row_of for p, d, _ in orders):
+                raise ValueError("New order uses a node without shortest path tree, build a new solver")
+            orders = [(row_of[p], row_of[d], val) for p, d, val in orders]
+        else:
+            orders = list(orders)
+
+        # Match orders of the new list with the old ones, equal orders one by one
+        free = defaultdict(list)
+        for old, order in enumerate(self.orders):
+            free[tuple(order)].append(old)
+        old_index = [free[tuple(order)].pop(0) if free[tuple(order)] else None for order in orders]
+        kept = {old: new for new, old in enumerate(old_index) if old is not None}
+        added = [new for new, old in enumerate(old_index) if old is None]
+
+        # Pheromone is per order: trails between kept orders (and the base) move to their new slots,
+        # trails of removed orders go away with them, new orders start at the learned level
+        old_slot = np.array([-1 if old is None else old for old in old_index] + [len(self.orders)])
+        known = old_slot >= 0
+        learned = self.pheromone[np.ix_(old_slot[known], old_slot[known])]
+        pheromone = np.full((len(orders) + 1, len(orders) + 1), learned.mean())
+        pheromone[np.ix_(known, known)] = learned
+        self.pheromone = pheromone
+
+        self.orders = orders
+        self.revenue = sum(o[2] for o in orders)
+        self.leg_cost = np.array([self.dist_matrix[p, d] for p, d, _ in orders], dtype=float)
+        self._init_order_cost()
+        if self.candidates is not None:
+            self._build_candidate_lists(self.candidates)
+
+        # Previous best without removed orders, new ones inserted where they cost the least
+        C = self.order_cost
+        base = len(orders)
+        tour = [base] + [kept[o] for o in (self.orders_sequence_history or []) if o in kept] + [base]
+        for new in added:
+            delta = [C[a, new] + C[new, b] - C[a, b] for a, b in zip(tour[:-1], tour[1:])]
+            tour.insert(int(np.argmin(delta)) + 1, new)
+        best_seq = tour[1:-1]
+        self.global_best_dist = float(self.service_dist + C[tour[:-1], tour[1:]].sum())
+        self.orders_sequence_history = best_seq
+        self.global_best_path = self._build_path(best_seq)
+        if 0 < self.global_best_dist < 1e9:
+            self._deposit(best_seq, 100.0 / self.global_best_dist)          # Colony starts around the repaired tour
+
+        self.iterations = iterations
+        self.history_best_dist = []                                         # History of this re-solve only
+        return self.solve(callback, time_limit, patience)
+
     def _run_ant(self):
         current_node = self.base_node                       # Start in base
-        path = [current_node]                               # On the beginning path has only one city
+        current_slot = len(self.orders)                     # Base is the virtual order of the order graph
         total_dist = 0
         order_sequence = []                                 # List to store order execution sequence
         
@@ -138,9 +599,17 @@ class AntColonyOptimization:
 
         while remaining_orders:
             allowed_orders_indices = list(range(len(remaining_orders)))                                 # List index
-            potential_pickups = [self.orders[remaining_orders[i]][0] for i in allowed_orders_indices]   # List with cities, where we need take a order
+            if self.candidates is not None:                                                             # Only nearest pickups if any is left
+                candidate_mask = self.candidate_mask[self.candidate_row[current_node]]
+                candidate_indices = [i for i in allowed_orders_indices if candidate_mask[remaining_orders[i]]]
+                self.candidate_steps += 1
+                if candidate_indices:
+                    allowed_orders_indices = candidate_indices
+                else:
+                    self.candidate_fallbacks += 1
+            potential_orders = [remaining_orders[i] for i in allowed_orders_indices]                    # List with orders we can take next
             
-            probs = self._get_move_probability(current_node, potential_pickups)                         # List with probabilities, it helps to take a decision where to go in next move
+            probs = self._get_move_probability(current_slot, potential_orders)                          # List with probabilities, it helps to take a decision where to go in next move
             
             local_index = np.random.choice(allowed_orders_indices, p=probs)                             # Choice index from list with weights
             order_index = remaining_orders.pop(local_index)                                             # Assign the actual order and delete index where we picked up a order
@@ -148,62 +617,665 @@ class AntColonyOptimization:
             
             p_node, d_node, _ = self.orders[order_index]                                                # Assign pick_up and delivery node from order_index
             
-            total_dist += self.dist_matrix[current_node, p_node]                                        # Add distance from current node to pick_up node
-            segment_p = self._get_full_path_(current_node, p_node)
-            path.extend(segment_p[1:])           
-
-            total_dist += self.dist_matrix[p_node, d_node]                                              # Add distance from pick_up node to delivery node
-            segment_d = self._get_full_path_(p_node, d_node)
-            path.extend(segment_d[1:])
+            total_dist += self.distance_cost * self.dist_matrix[current_node, p_node]                    # Add distance from current node to pick_up node
+            total_dist += self.leg_cost[order_index]                                                    # Add cost of pick_up -> delivery leg
             
             current_node = d_node                                                                       # Change current node to delivery node
+            current_slot = order_index
             
         if current_node != self.base_node:                                                              # Security, where the end of order is in base
-            total_dist += self.dist_matrix[current_node, self.base_node]                                # Comeback to base
-            segment_b = self._get_full_path_(current_node, self.base_node)
-            path.extend(segment_b[1:])
+            total_dist += self.distance_cost * self.dist_matrix[current_node, self.base_node]           # Comeback to base
+
+        return total_dist, order_sequence                                                               # Full path is built lazily in _build_path
+
+    def _run_colony(self):
+        n_orders = len(self.orders)
+        pickups = np.array([o[0] for o in self.orders], dtype=int)
+        deliveries = np.array([o[1] for o in self.orders], dtype=int)
+        ants = np.arange(self.ants)
+
+        current_nodes = np.full(self.ants, self.base_node)                  # Every ant starts in base
+        current_slots = np.full(self.ants, n_orders)                        # Base slot of the order graph
+        remaining = np.ones((self.ants, n_orders), dtype=bool)             # (ants x orders) orders still to do
+        sequences = np.empty((self.ants, n_orders), dtype=int)              # Order sequence of every ant
+        total_dist = np.zeros(self.ants)
+
+        for step in range(n_orders):
+            # Transition weights of all ants to all pickups in one expression
+            allowed = remaining
+            if self.candidates is not None:                                 # Only nearest pickups if any is left
+                allowed = remaining & self.candidate_mask[self.candidate_row[current_nodes]]
+                fallback = ~allowed.any(axis=1)
+                allowed[fallback] = remaining[fallback]
+                self.candidate_steps += self.ants
+                self.candidate_fallbacks += int(fallback.sum())
 
-        cleaned_path = [path[0]]                                                                        # Create new list to delete repetitive nodes next to each other
+            weights = self.choice_info[current_slots, :n_orders]            # Row gather copies, safe to mask
+            weights[~allowed] = 0                                           # Done orders and non candidates
+
+            stuck = weights.sum(axis=1) <= 1e-12                            # Underflow: random choose from allowed
+            weights[stuck] = allowed[stuck]
+
+            # Inverse CDF: one uniform draw per ant, first order where cumulative weight exceeds it
+            cdf = np.cumsum(weights, axis=1)
+            draw = np.random.random(self.ants) * cdf[:, -1]
+            chosen = np.argmax(cdf > draw[:, None], axis=1)
+
+            sequences[:, step] = chosen
+            remaining[ants, chosen] = False
+
+            p_nodes, d_nodes = pickups[chosen], deliveries[chosen]
+            total_dist += self.distance_cost * self.dist_matrix[current_nodes, p_nodes]   # Current node -> pickup
+            total_dist += self.leg_cost[chosen]                                           # Pickup -> delivery
+            current_nodes = d_nodes
+            current_slots = chosen
+
+        total_dist += self.distance_cost * self.dist_matrix[current_nodes, self.base_node]  # Comeback to base
+        return total_dist, sequences                                        # (ants x steps) array, rows deposit as they are
+
+    def _run_ant_capacity(self):
+        n_orders = len(self.orders)
+        current_node = self.base_node
+        current_slot = 2 * n_orders                                                             # Base after all events
+        total_dist = 0
+        events = []
+        loaded, remaining = set(), set(range(n_orders))
+
+        while remaining or loaded:
+            allowed = [n_orders + o for o in sorted(loaded)]                                      # Deliveries of loaded parcels
+            if len(loaded) < self.capacity:
+                allowed = sorted(remaining) + allowed                                           # Pickups only with free space
+            probs = self._get_move_probability(current_slot, allowed)
+            event = int(np.random.choice(allowed, p=probs))
+            events.append(event)
+            current_slot = event
+
+            if event < n_orders:
+                remaining.discard(event)
+                loaded.add(event)
+            else:
+                loaded.discard(event - n_orders)
+
+            next_node = self.event_nodes[event]
+            total_dist += self.dist_matrix[current_node, next_node]
+            current_node = next_node
+
+        total_dist += self.dist_matrix[current_node, self.base_node]                            # Comeback to base
+        return total_dist, events
+
+    def _run_colony_capacity(self):
+        n_orders = len(self.orders)
+        ants = np.arange(self.ants)
+
+        current_nodes = np.full(self.ants, self.base_node)
+        current_slots = np.full(self.ants, 2 * n_orders)
+        picked = np.zeros((self.ants, n_orders), dtype=bool)
+        delivered = np.zeros((self.ants, n_orders), dtype=bool)
+        load = np.zeros(self.ants, dtype=int)                               # Parcels on board of every ant
+        sequences = np.empty((self.ants, 2 * n_orders), dtype=int)
+        total_dist = np.zeros(self.ants)
+
+        for step in range(2 * n_orders):
+            # Pickups need free space, deliveries need the parcel on board
+            allowed = np.hstack((~picked & (load < self.capacity)[:, None], picked & ~delivered))
+
+            weights = self.choice_info[current_slots, :2 * n_orders]
+            weights[~allowed] = 0
+
+            stuck = weights.sum(axis=1) <= 1e-12
+            weights[stuck] = allowed[stuck]
+
+            cdf = np.cumsum(weights, axis=1)
+            draw = np.random.random(self.ants) * cdf[:, -1]
+            chosen = np.argmax(cdf > draw[:, None], axis=1)
+
+            sequences[:, step] = chosen
+            is_pickup = chosen < n_orders
+            picked[ants[is_pickup], chosen[is_pickup]] = True
+            delivered[ants[~is_pickup], chosen[~is_pickup] - n_orders] = True
+            load += np.where(is_pickup, 1, -1)
+
+            next_nodes = self.event_nodes[chosen]
+            total_dist += self.dist_matrix[current_nodes, next_nodes]
+            current_nodes = next_nodes
+            current_slots = chosen
+
+        total_dist += self.dist_matrix[current_nodes, self.base_node]      # Comeback to base
+        return total_dist, sequences                                        # (ants x steps) array, rows deposit as they are
+
+    def _segment(self, u, v):
+        return tuple(self._get_full_path_(u, v))
+
+    def _build_path(self, order_sequence):
+        current_node = self.base_node
+        path = [self.terminals[current_node]]                            # On the beginning path has only one city
+        if self.capacity > 1:                                            # Events: drive from one event node to the next
+            for node in self.event_nodes[order_sequence].tolist() + [self.base_node]:
+                path.extend(self._segment_path(current_node, node)[1:])
+                current_node = node
+            order_sequence = []
+        for order_index in order_sequence:
+            p_node, d_node, _ = self.orders[order_index]
+            path.extend(self._segment_path(current_node, p_node)[1:])
+            if self.leg_paths is not None:
+                path.extend(self.leg_paths[order_index][1:])                # Safer leg chosen with protection cost
+            else:
+                path.extend(self._segment_path(p_node, d_node)[1:])
+            current_node = d_node
+        if current_node != self.base_node:                               # Security, where the end of order is in base
+            path.extend(self._segment_path(current_node, self.base_node)[1:])
+
+        cleaned_path = [path[0]]                                         # Delete repetitive nodes next to each other
         for node in path[1:]:
             if node != cleaned_path[-1]:
                 cleaned_path.append(node)
-        path = cleaned_path
+        return cleaned_path
+
+class FleetAntColonyOptimization(AntColonyOptimization):
+    # m couriers leave the base; a tour is a list of m order sequences (one per vehicle)
+    def __init__(self, dist_matrix, orders, base_node, params, vehicles=2, fleet_objective="makespan", **kwargs):
+        super().__init__(dist_matrix, orders, base_node, params, **kwargs)
+        if self.capacity > 1 or self.candidates is not None or self.construction != "sequential":
+            raise ValueError("Fleet supports only sequential construction without capacity and candidates")
+        if fleet_objective not in ("makespan", "total"):
+            raise ValueError(f"Unknown fleet objective: {fleet_objective}")
+        self.vehicles = vehicles
+        self.fleet_objective = fleet_objective                              # Longest route or sum of routes
+
+    def fleet_cost(self, route_costs):
+        return max(route_costs) if self.fleet_objective == "makespan" else sum(route_costs)
+
+    def route_cost(self, order_seq):
+        # Cost of one vehicle: empty driving between orders and legs, start and end in base
+        stops = [self.base_node] + [n for o in order_seq for n in self.orders[o][:2]] + [self.base_node]
+        empty = self.dist_matrix[stops[:-1:2], stops[1::2]].sum()
+        return self.distance_cost * empty + self.leg_cost[list(order_seq)].sum()
+
+    def _run_ant(self):
+        current_nodes = np.full(self.vehicles, self.base_node)
+        current_slots = np.full(self.vehicles, len(self.orders))           # Every vehicle starts in the base slot
+        route_costs = np.zeros(self.vehicles)
+        plan = [[] for _ in range(self.vehicles)]
+        remaining_orders = list(range(len(self.orders)))
+
+        while remaining_orders:
+            # Makespan: shortest route so far takes the next order; total: any vehicle may take it
+            if self.fleet_objective == "makespan":
+                vehicles = np.array([int(np.argmin(route_costs))])
+            else:
+                vehicles = np.arange(self.vehicles)
+
+            # Assignment step: one draw over (vehicle, order) pairs from the shared choice_info
+            weights = self.choice_info[current_slots[vehicles][:, None], np.array(remaining_orders)[None, :]].ravel()
+            total = weights.sum()
+            probs = weights / total if total > 1e-12 else np.full(len(weights), 1.0 / len(weights))
+            pair = np.random.choice(len(weights), p=probs)
+
+            vehicle = vehicles[pair // len(remaining_orders)]
+            order_index = remaining_orders.pop(pair % len(remaining_orders))
+            p_node, d_node, _ = self.orders[order_index]
+            route_costs[vehicle] += self.distance_cost * self.dist_matrix[current_nodes[vehicle], p_node]
+            route_costs[vehicle] += self.leg_cost[order_index]
+            current_nodes[vehicle] = d_node
+            current_slots[vehicle] = order_index
+            plan[vehicle].append(order_index)
+
+        route_costs += self.distance_cost * self.dist_matrix[current_nodes, self.base_node]  # Everybody returns
+        return self.fleet_cost(route_costs), plan
+
+    def _local_search(self, plan):
+        # Every route separately; service_dist of the parent counts all orders, keep only own legs
+        improved = []
+        for order_seq in plan:
+            seq, cost = super()._local_search(order_seq)
+            improved.append((seq, cost - self.service_dist + self.leg_cost[order_seq].sum()))
+        return [seq for seq, _ in improved], self.fleet_cost([cost for _, cost in improved])
+
+    def _tour_edges(self, plan):
+        edges = [super(FleetAntColonyOptimization, self)._tour_edges(order_seq)
+                 for order_seq in plan if order_seq]                        # Idle vehicle leaves no trail
+        if not edges:
+            return np.array([], dtype=int), np.array([], dtype=int)
+        return np.concatenate([a for a, _ in edges]), np.concatenate([b for _, b in edges])
+
+    def _build_path(self, plan):
+        return [super(FleetAntColonyOptimization, self)._build_path(order_seq) for order_seq in plan]
+
+    def warm_start(self, orders, iterations=10, callback=None, time_limit=None, patience=None):
+        raise ValueError("Warm start is not supported for a fleet, build a new solver")
+
+
+def _edge_weights(matrix):
+    # Input matrix -> float matrix of direct edges, inf where there is no connection
+    raw = np.asarray(matrix)
+    if raw.dtype == object:
+        missing = np.equal(raw, None)                                      # None means no direct connection
+        return np.where(missing, float('inf'), raw).astype(float)
+    dist = raw.astype(float)                                               # Copy, input matrix stays untouched
+    dist[np.isnan(dist)] = float('inf')
+    return dist
+
+
+def _floyd_warshall_arrays(dist):
+    # Vectorized Floyd-Warshall in place on a matrix of direct edges
+    n = dist.shape[0]
+    np.fill_diagonal(dist, 0)                                              # Put 0 on diagonal
+    next_node = np.where(np.isfinite(dist), np.arange(n)[None, :], -1)     # Direct edge: next node is the target
+    np.fill_diagonal(next_node, -1)
+
+    through_k = np.empty_like(dist)                                        # Buffer reused in every k step
+    for k in range(n):
+        # Whole k step at once: row k and column k do not change in this step
+        np.add(dist[:, k, None], dist[k, None, :], out=through_k)
+        better = through_k < dist
+        np.copyto(dist, through_k, where=better)
+        np.copyto(next_node, next_node[:, k, None].copy(), where=better)
 
-        return path, total_dist, order_sequence
+    dist[dist == float('inf')] = 1e9 # Change inf to vary big number
+    return dist, next_node
 
-# --- ZMIANY W PARAMETRACH DLA WIDOCZNEJ ZBIEŻNOŚCI ---
-# Przy 40 miastach Beta=4.0 jest OK, ale Alfa powinna być wyższa, by mrówki słuchały feromonów.
-# Rho=0.1 pozwala feromonom trwać wystarczająco długo, by kolonia się uczyła.
 
+class ShortestPathStore:
+    # All pairs shortest paths kept between solves. Inserting an edge or lowering its weight is an O(n^2)
+    # relaxation, removing or raising one marks the store stale and the next read recomputes everything.
+    # A new store is stale too: a whole map can be loaded first and solved once on the first read
+    def __init__(self, matrix=None):
+        self.weights = np.empty((0, 0)) if matrix is None else _edge_weights(matrix)   # Direct edges, inf = none
+        self.dist = self.next_node = None
+        self.stale = True
+        self.incremental_updates = 0
+        self.full_recomputes = 0
 
-params = (150, 60, 1.0, 4.0, 0.1)
+    def _recompute(self):
+        self.dist, self.next_node = _floyd_warshall_arrays(self.weights.copy())
+        self.stale = False
+        self.full_recomputes += 1
 
-np.random.seed(42)
-size = 40
-dist_m = np.random.randint(10, 101, size=(size, size)).astype(object)
+    def add_node(self):
+        n = len(self.weights)
+        self.weights = np.pad(self.weights, ((0, 1), (0, 1)), constant_values=float('inf'))
+        if self.stale:
+            return n
+        self.dist = np.pad(self.dist, ((0, 1), (0, 1)), constant_values=1e9)    # New node is not connected yet
+        self.dist[n, n] = 0
+        self.next_node = np.pad(self.next_node, ((0, 1), (0, 1)), constant_values=-1)
+        return n
 
-for i in range(size):
-    for j in range(i, size):
-        if i == j:
-            dist_m[i, j] = None
+    def set_edge(self, u, v, weight, symmetric=True):
+        for a, b in ((u, v), (v, u)) if symmetric else ((u, v),):
+            old = self.weights[a, b]
+            self.weights[a, b] = weight
+            if weight > old:
+                self.stale = True                                          # Some shortest paths may get longer
+            elif not self.stale:
+                self._relax(a, b, weight)
+
+    def remove_edge(self, u, v, symmetric=True):
+        self.weights[u, v] = float('inf')
+        if symmetric:
+            self.weights[v, u] = float('inf')
+        self.stale = True
+
+    def _relax(self, u, v, weight):
+        # d[i][j] = min(d[i][j], d[i][u] + w + d[v][j]) for all pairs at once
+        through = self.dist[:, u, None] + weight + self.dist[None, v, :]
+        better = through < self.dist
+        if not better.any():
+            return
+        hop = self.next_node[:, u].copy()                                  # First step of i -> u, from u itself go to v
+        hop[u] = v
+        np.copyto(self.dist, through, where=better)
+        np.copyto(self.next_node, hop[:, None], where=better)
+        self.incremental_updates += 1
+
+    def adopt(self, dist, next_node, weights):
+        # Full recompute done elsewhere (e.g. in a worker thread) from the direct edges in weights;
+        # arrays of another graph or of an older version of this one are rejected
+        if weights.shape != self.weights.shape or not np.array_equal(weights, self.weights):
+            raise ValueError("Shortest paths were computed for a different graph")
+        if dist.shape != self.weights.shape or next_node.shape != self.weights.shape:
+            raise ValueError(f"Shortest path arrays {dist.shape} do not match {len(self.weights)} nodes")
+        self.dist, self.next_node = dist, next_node
+        self.stale = False
+        self.full_recomputes += 1
+
+    def shortest_paths(self):
+        # Same tuple as AntColonyOptimization(shortest_paths=...) takes
+        if self.stale:
+            self._recompute()
+        return self.dist, self.next_node, None, np.arange(len(self.dist))
+
+
+def _share_array(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach_array(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _share_arrays(arrays):
+    # {key: array or None} -> shared memory blocks and {key: spec or None} for workers
+    blocks, shared = [], {}
+    for key, array in arrays.items():
+        if array is None:
+            shared[key] = None
+            continue
+        shm, shared[key] = _share_array(array)
+        blocks.append(shm)
+    return blocks, shared
+
+
+def _attach_arrays(shared):
+    blocks, arrays = [], {}
+    for key, spec in shared.items():
+        if spec is None:
+            arrays[key] = None
+            continue
+        shm, arrays[key] = _attach_array(spec)
+        blocks.append(shm)
+    return blocks, arrays
+
+
+def _colony_epoch(task):
+    # One colony, migration_interval iterations; matrices and pheromone live in shared memory
+    blocks, arrays = _attach_arrays(task["shared"])
+    try:
+        colony = task["colony"]
+        shortest_paths = (arrays["dist_matrix"], arrays["next_node"], arrays["predecessors"], arrays["terminals"])
+        aco = AntColonyOptimization(arrays["dist_matrix"], task["orders"], task["base_node"], task["params"],
+                                    shortest_paths=shortest_paths, **task["options"])
+        aco.pheromone = arrays["pheromone"][colony]                         # View, updates go straight to shared memory
+        aco.iterations = task["iterations"]
+        aco.mmas_iteration = task["mmas_iteration"]                         # Pheromone already lives in shared memory
+
+        if task["rng_state"] is None:
+            np.random.seed(task["seed"])
         else:
-            # Szansa 30% na brak bezpośredniego połączenia (None)
-            if np.random.rand() < 0.3:
+            np.random.set_state(task["rng_state"])
+
+        if task["best_sequence"] is not None:                               # Continue from the colony best so far
+            aco.global_best_dist = task["best_dist"]
+            aco.orders_sequence_history = task["best_sequence"]
+        if task["immigrant"] is not None:
+            aco.accept_immigrant(*task["immigrant"])
+
+        aco.solve()
+        result = (colony, float(aco.global_best_dist), [int(o) for o in aco.orders_sequence_history],
+                  [float(d) for d in aco.history_best_dist], np.random.get_state(), aco.mmas_iteration)
+    finally:
+        aco = shortest_paths = None
+        arrays.clear()
+        for shm in blocks:
+            shm.close()
+    return result
+
+
+def solve_multi_colony(dist_matrix, orders, base_node, params, colonies=4, migration_interval=10,
+                       workers=None, seed=None, backend="numpy", **options):
+    # Shortest paths are computed once and shared with every worker instead of being pickled
+    master = AntColonyOptimization(dist_matrix, orders, base_node, params, backend=backend, **options)
+    pheromone = np.repeat(master.pheromone[None], colonies, axis=0)        # Separate order graph trail for every colony
+
+    blocks, shared = _share_arrays({"dist_matrix": master.dist_matrix, "next_node": master.next_node,
+                                    "predecessors": master.predecessors, "terminals": master.terminals,
+                                    "pheromone": pheromone})
+
+    if master.objective == "profit":                                        # Legs need the raw graph, send them ready
+        options = dict(options, legs=(master.leg_cost, master.leg_paths), risk_matrix=None)
+
+    seeds = np.random.SeedSequence(seed).generate_state(colonies)           # Own seed for every colony
+    rng_states = [None] * colonies
+    mmas_iterations = [0] * colonies
+    bests = [(float('inf'), None)] * colonies
+    colony_histories = [[] for _ in range(colonies)]
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers or colonies) as executor:
+            done = 0
+            while done < params[0]:
+                iterations = min(migration_interval, params[0] - done)
+                tasks = []
+                for colony in range(colonies):
+                    # Ring migration: colony gets the best tour of the previous one
+                    neighbour_dist, neighbour_seq = bests[(colony - 1) % colonies]
+                    tasks.append({
+                        "shared": shared, "colony": colony, "orders": orders, "base_node": base_node,
+                        "params": params, "options": options, "iterations": iterations,
+                        "seed": int(seeds[colony]), "rng_state": rng_states[colony],
+                        "mmas_iteration": mmas_iterations[colony],
+                        "best_dist": bests[colony][0], "best_sequence": bests[colony][1],
+                        "immigrant": (neighbour_seq, neighbour_dist) if neighbour_seq is not None else None,
+                    })
+                for colony, best_dist, best_sequence, history, rng_state, mmas_iteration in executor.map(_colony_epoch, tasks):
+                    bests[colony] = (best_dist, best_sequence)
+                    rng_states[colony] = rng_state
+                    mmas_iterations[colony] = mmas_iteration
+                    colony_histories[colony].extend(history)
+                done += iterations
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    best_dist, best_sequence = min(bests, key=lambda x: x[0])
+    best_path = master._build_path(best_sequence)
+    history_best_dist = [min(h) for h in zip(*colony_histories)]            # Best of all colonies in every iteration
+    return best_path, best_dist, history_best_dist, best_sequence, colony_histories
+
+
+def _improve_route(task, shortest_paths, callback=None):
+    # Own colony for the orders of one vehicle, started from the route of the fleet colony.
+    # deadline is wall-clock time.time(), the same in every worker process
+    aco = AntColonyOptimization(shortest_paths[0], task["orders"], task["base_node"], task["params"],
+                                shortest_paths=shortest_paths, **task["options"])
+    np.random.seed(task["seed"])
+    aco.accept_immigrant(list(range(len(task["orders"]))), task["cost"])
+    time_limit = None if task["deadline"] is None else task["deadline"] - time.time()
+    if time_limit is not None and time_limit <= 0:
+        aco.stop_reason = "deadline"                                        # Budget is gone, keep the fleet route
+    else:
+        aco.solve(callback, time_limit, task["patience"])
+    return task["vehicle"], float(aco.global_best_dist), [int(o) for o in aco.orders_sequence_history], aco.stop_reason
+
+
+def _vehicle_route(task):
+    # stop is a one-byte flag in shared memory, the parent sets it when its callback asks to stop
+    blocks, arrays = _attach_arrays(dict(task["shared"], stop=task["stop"]))
+    try:
+        shortest_paths = (arrays["dist_matrix"], arrays["next_node"], arrays["predecessors"], arrays["terminals"])
+        stop = arrays["stop"]
+        result = _improve_route(task, shortest_paths, lambda history: bool(stop[0]))
+    finally:
+        shortest_paths = stop = None
+        arrays.clear()
+        for shm in blocks:
+            shm.close()
+    return result
+
+
+def solve_fleet(dist_matrix, orders, base_node, params, vehicles=2, fleet_objective="makespan",
+                refine_iterations=None, parallel_from=4, workers=None, seed=None, backend="numpy", callback=None,
+                time_limit=None, patience=None, **options):
+    # Fleet colony assigns orders to vehicles, then every route is improved by its own colony
+    # (in separate processes when at least parallel_from routes need it).
+    # time_limit covers both stages; callback(fleet history) can stop the serial refinement too
+    deadline = None if time_limit is None else time.time() + time_limit
+    if seed is not None:
+        np.random.seed(seed)
+    fleet = FleetAntColonyOptimization(dist_matrix, orders, base_node, params, vehicles=vehicles,
+                                       fleet_objective=fleet_objective, backend=backend, **options)
+    fleet.solve(callback, time_limit, patience)
+    plan = [list(order_seq) for order_seq in fleet.orders_sequence_history]
+    route_costs = [float(fleet.route_cost(order_seq)) for order_seq in plan]
+
+    refine_params = (refine_iterations or params[0],) + tuple(params[1:])
+    options.pop("shortest_paths", None)                                     # Routes get the fleet matrices below
+    options.pop("should_stop", None)                                        # Stays in this process, legs are ready
+    if fleet.objective == "profit":                                        # Legs are cut from the fleet colony
+        options = dict(options, risk_matrix=None)
+    tasks = []
+    for vehicle, order_seq in enumerate(plan):
+        if len(order_seq) < 2 or fleet.stop_reason in ("callback", "deadline"):  # Nothing to reorder or no time left
+            continue
+        task_options = options
+        if fleet.objective == "profit":
+            task_options = dict(options, legs=(fleet.leg_cost[order_seq], [fleet.leg_paths[o] for o in order_seq]))
+        tasks.append({"vehicle": vehicle, "orders": [orders[o] for o in order_seq], "base_node": base_node,
+                      "params": refine_params, "options": task_options, "cost": route_costs[vehicle],
+                      "seed": int(np.random.randint(2**31)), "deadline": deadline, "patience": patience})
+
+    shared_paths = {"dist_matrix": fleet.dist_matrix, "next_node": fleet.next_node,
+                    "predecessors": fleet.predecessors, "terminals": fleet.terminals}
+    if len(tasks) >= parallel_from:
+        blocks, shared = _share_arrays(shared_paths)
+        stop_shm, stop_spec = _share_array(np.zeros(1, dtype=np.int8))
+        blocks.append(stop_shm)
+        stop = np.ndarray((1,), dtype=np.int8, buffer=stop_shm.buf)
+        try:
+            for task in tasks:
+                task["shared"] = shared
+                task["stop"] = stop_spec
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_vehicle_route, task) for task in tasks]
+                pending = set(futures)
+                while pending:
+                    # Workers cannot call back, the parent polls the callback and raises the shared flag
+                    _, pending = wait(pending, timeout=0.2)
+                    if pending and callback is not None and callback(fleet.history_best_dist):
+                        stop[0] = 1
+                        for future in pending:
+                            future.cancel()                                 # Not started yet, keep the fleet route
+                results = [future.result() for future in futures if not future.cancelled()]
+        finally:
+            stop = None
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+    else:
+        # Refinement only asks whether to stop, progress stays the fleet history
+        route_callback = None if callback is None else (lambda history: callback(fleet.history_best_dist))
+        results = []
+        for task in tasks:
+            results.append(_improve_route(task, tuple(shared_paths.values()), route_callback))
+            if results[-1][3] == "callback":                                # Stopped from outside, skip other routes
+                break
+
+    for vehicle, cost, order_seq, _ in results:
+        if cost < route_costs[vehicle]:                                     # Back to indices of the whole order list
+            plan[vehicle] = [plan[vehicle][o] for o in order_seq]
+            route_costs[vehicle] = cost
+
+    paths = fleet._build_path(plan)
+    return paths, fleet.fleet_cost(route_costs), fleet.history_best_dist, plan, route_costs
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="ACO Optymalizacja Trasy (demo na losowym grafie)")
+    parser.add_argument('--demo', action='store_true', help='Uruchom demo na losowym grafie')
+    parser.add_argument('--size', type=int, default=40, help='Liczba miast')
+    parser.add_argument('--iterations', type=int, default=150, help='Liczba iteracji')
+    parser.add_argument('--ants', type=int, default=60, help='Liczba mrówek')
+    parser.add_argument('--alpha', type=float, default=1.0, help='Waga feromonów')
+    parser.add_argument('--beta', type=float, default=4.0, help='Waga odległości')
+    parser.add_argument('--rho', type=float, default=0.1, help='Współczynnik parowania')
+    parser.add_argument('--seed', type=int, default=42, help='Ziarno losowania')
+    parser.add_argument('--backend', default="numpy", choices=["numpy", "loop", "dijkstra"], help='Silnik najkrótszych ścieżek')
+    parser.add_argument('--construction', default="sequential", choices=["sequential", "batched"], help='Budowa tras mrówek')
+    parser.add_argument('--candidates', type=int, default=None, help='Liczba najbliższych odbiorów branych pod uwagę')
+    parser.add_argument('--local_search', action='store_true', help='2-opt / Or-opt / zamiana na elitarnych mrówkach')
+    parser.add_argument('--colonies', type=int, default=1, help='Liczba niezależnych kolonii (procesów)')
+    parser.add_argument('--migration', type=int, default=10, help='Co ile iteracji kolonie wymieniają najlepsze trasy')
+    parser.add_argument('--capacity', type=int, default=1, help='Ile paczek kurier może wieźć naraz')
+    parser.add_argument('--time_limit', type=float, default=None, help='Limit czasu w sekundach')
+    parser.add_argument('--patience', type=int, default=None, help='Stop po tylu iteracjach bez poprawy')
+    parser.add_argument('--vehicles', type=int, default=1, help='Liczba kurierów wyjeżdżających z bazy')
+    parser.add_argument('--pheromone_rule', default="elitist", choices=["elitist", "mmas"],
+                        help='Aktualizacja feromonów: elitarne mrówki albo MAX-MIN Ant System')
+    parser.add_argument('--fleet_objective', default="makespan", choices=["makespan", "total"],
+                        help='Flota: najdłuższa trasa albo suma tras')
+
+    args = parser.parse_args()
+    if not args.demo:
+        parser.print_help()
+        raise SystemExit
+
+    # --- ZMIANY W PARAMETRACH DLA WIDOCZNEJ ZBIEŻNOŚCI ---
+    # Przy 40 miastach Beta=4.0 jest OK, ale Alfa powinna być wyższa, by mrówki słuchały feromonów.
+    # Rho=0.1 pozwala feromonom trwać wystarczająco długo, by kolonia się uczyła.
+    params = (args.iterations, args.ants, args.alpha, args.beta, args.rho)
+
+    np.random.seed(args.seed)
+    size = args.size
+    dist_m = np.random.randint(10, 101, size=(size, size)).astype(object)
+
+    for i in range(size):
+        for j in range(i, size):
+            if i == j:
                 dist_m[i, j] = None
-                dist_m[j, i] = None
             else:
-                dist_m[j, i] = dist_m[i, j]
-orders = [
-    (0, 15, 100), (4, 19, 50), (12, 1, 80), (7, 3, 120), (18, 5, 60),
-    (22, 35, 90), (39, 10, 110), (25, 8, 70), (33, 2, 130), (11, 28, 85),
-    (30, 5, 95), (14, 38, 120), (2, 21, 65), (36, 17, 105), (9, 31, 75),
-    (20, 6, 115), (13, 27, 80), (37, 3, 140), (1, 24, 55), (29, 32, 90)
-]
-base = 4
+                # Szansa 30% na brak bezpośredniego połączenia (None)
+                if np.random.rand() < 0.3:
+                    dist_m[i, j] = None
+                    dist_m[j, i] = None
+                else:
+                    dist_m[j, i] = dist_m[i, j]
+
+    # Zamówienia z demo dla 40 miast, dla innych rozmiarów losowane
+    orders = [
+        (0, 15, 100), (4, 19, 50), (12, 1, 80), (7, 3, 120), (18, 5, 60),
+        (22, 35, 90), (39, 10, 110), (25, 8, 70), (33, 2, 130), (11, 28, 85),
+        (30, 5, 95), (14, 38, 120), (2, 21, 65), (36, 17, 105), (9, 31, 75),
+        (20, 6, 115), (13, 27, 80), (37, 3, 140), (1, 24, 55), (29, 32, 90)
+    ]
+    if size != 40:
+        orders = []
+        for _ in range(min(20, size // 2)):
+            p_node, d_node = np.random.choice(size, 2, replace=False)
+            orders.append((int(p_node), int(d_node), int(np.random.randint(50, 150))))
+    base = 4 % size
+
+    if args.vehicles > 1:
+        paths, best_dist, history, plan, route_costs = solve_fleet(
+            dist_m, orders, base, params, vehicles=args.vehicles, fleet_objective=args.fleet_objective,
+            seed=args.seed, backend=args.backend, local_search=args.local_search, pheromone_rule=args.pheromone_rule,
+            time_limit=args.time_limit, patience=args.patience)
+        print(f"Koszt floty ({args.fleet_objective}): {best_dist:.2f}")
+        for vehicle, (path, order_seq, cost) in enumerate(zip(paths, plan, route_costs)):
+            print(f"Kurier {vehicle}: dystans {cost:.2f}, zlecenia {order_seq}, trasa {[int(x) for x in path]}")
+        raise SystemExit
 
-aco = AntColonyOptimization(dist_m, orders, base, params)    # Create simulation
-best_path, best_dist, history, orders_sequence = aco.solve() # Start simulation
+    if args.colonies > 1:
+        best_path, best_dist, history, orders_sequence, _ = solve_multi_colony(
+            dist_m, orders, base, params, colonies=args.colonies, migration_interval=args.migration,
+            seed=args.seed, backend=args.backend, construction=args.construction, candidates=args.candidates,
+            local_search=args.local_search, capacity=args.capacity, pheromone_rule=args.pheromone_rule)
+    else:
+        aco = AntColonyOptimization(dist_m, orders, base, params, backend=args.backend,
+                                    construction=args.construction, candidates=args.candidates,
+                                    local_search=args.local_search, capacity=args.capacity,
+                                    pheromone_rule=args.pheromone_rule)                                  # Create simulation
+        best_path, best_dist, history, orders_sequence = aco.solve(time_limit=args.time_limit,
+                                                                   patience=args.patience)  # Start simulation
 
-best_path = [int(x) for x in best_path] 
-history = [int(x) for x in history]
+    best_path = [int(x) for x in best_path] 
+    history = [int(x) for x in history]
 
+    print(f"Najlepszy dystans: {best_dist:.2f}")
+    if args.capacity > 1:
+        n_orders = len(orders)
+        events = [f"{e % n_orders}{'p' if e < n_orders else 'd'}" for e in orders_sequence]
+        print(f"Kolejność zdarzeń: {events}")
+    else:
+        print(f"Kolejność zleceń: {[int(x) for x in orders_sequence]}")
+    print(f"Trasa: {best_path}")
+    print(f"Historia najlepszych dystansów: {history}")
+    if args.colonies == 1:
+        print(f"Powód zatrzymania: {aco.stop_reason} po {len(history)} iteracjach")
+    if args.candidates is not None and args.colonies == 1:
+        print(f"Brak kandydatów (pełny wybór): {aco.candidate_fallback_rate():.1%} decyzji")
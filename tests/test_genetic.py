@@ -0,0 +1,71 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+import genetic
+
+
+def random_instance(seed, length, orders):
+    # Route of (node, robbery probability, protection cost) and orders placed on its nodes
+    rng = np.random.default_rng(seed)
+    nodes = rng.integers(0, max(2, length // 3), size=length)
+    route = [(int(n), float(rng.uniform(0.0, 0.5)), int(rng.integers(5, 100))) for n in nodes]
+    parcels = []
+    for _ in range(orders):
+        p_node, d_node = rng.choice(nodes, 2, replace=False)
+        parcels.append((int(p_node), int(d_node), int(rng.integers(50, 1000))))
+    return route, parcels
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+@pytest.mark.parametrize("capacity", [1, 2])
+@pytest.mark.parametrize("seed", range(10))
+def test_ga_never_beats_exact(seed, capacity, vectorized):
+    route, parcels = random_instance(seed, 40, 4)
+    random.seed(seed)
+    np.random.seed(seed)
+    ga = genetic.SingleCargoGA(route, parcels, pop_size=30, generations=20, vectorized=vectorized, capacity=capacity)
+    _, ga_history = ga.run()
+    _, exact_history = ga.run_exact()
+    assert ga_history[-1] <= exact_history[-1] + 1e-9 * max(1.0, abs(exact_history[-1]))
+
+
+@pytest.mark.parametrize("capacity", [1, 2])
+@pytest.mark.parametrize("seed", range(10))
+def test_exact_matches_brute_force(seed, capacity):
+    route, parcels = random_instance(seed, 10, 3)
+    ga = genetic.SingleCargoGA(route, parcels, capacity=capacity)
+    best_sol, exact_history = ga.run_exact()
+    brute = max(ga.fitness(chromosome) for chromosome in itertools.product((0, 1), repeat=len(route)))
+    assert exact_history[-1] == pytest.approx(brute)
+    assert ga.fitness(best_sol) == pytest.approx(exact_history[-1])
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_lagrangian_feasible_and_not_above_dp(seed):
+    route, parcels = random_instance(seed, 60, 5)
+    planner = genetic.ProtectionPlanner(route, parcels)
+    saving = planner.ga.expected_loss - planner.ga.cost_security
+    items = np.flatnonzero(saving > 0)
+    weights = np.ceil(planner.ga.cost_security[items]).astype(int)
+    budget = int(weights.sum() // 2)
+    lagrange = planner._lagrangian(weights, saving[items], budget)
+    dp = planner._knapsack_dp(weights, saving[items], budget)
+    assert weights[lagrange].sum() <= budget
+    assert saving[items][lagrange].sum() <= saving[items][dp].sum() + 1e-9
+
+
+def test_cargo_follows_planned_events():
+    # Route 0,1,2,3,4,3,2,5 with A(1->4), B(2->5), C(3->4); plan pA pC dA dC pB dB, B is not loaded on the first pass
+    route = [(node, 0.1, 10) for node in (0, 1, 2, 3, 4, 3, 2, 5)]
+    parcels = [(1, 4, 100), (2, 5, 10), (3, 4, 1000)]
+    events = [(0, 'p'), (2, 'p'), (0, 'd'), (2, 'd'), (1, 'p'), (1, 'd')]
+    ga = genetic.SingleCargoGA(route, parcels, capacity=2, events=events)
+    values, order_ids, actions, loaded_orders = ga._simulate_cargo_on_route()
+    assert loaded_orders == [0, 2, 1]
+    assert list(values) == [0, 100, 100, 1100, 0, 0, 10, 0]
+    assert list(actions) == [genetic.ACTION_EMPTY, genetic.ACTION_LOAD, genetic.ACTION_CARRY, genetic.ACTION_LOAD,
+                             genetic.ACTION_UNLOAD, genetic.ACTION_EMPTY, genetic.ACTION_LOAD, genetic.ACTION_UNLOAD]
+    assert order_ids[6] == 1
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fresh interpreter: numpy first, then mrowa2, each timed separately
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import numpy
+numpy_done = time.perf_counter()
+import mrowa2
+mrowa2_done = time.perf_counter()
+print(numpy_done - start, mrowa2_done - numpy_done)
+print(sorted(name for name in vars(mrowa2) if name in ("aco", "dist_m", "best_path", "history")))
+"""
+
+
+def import_mrowa2():
+    result = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    return result.stdout.splitlines()
+
+
+def test_import_runs_no_solve():
+    lines = import_mrowa2()
+    assert len(lines) == 2, "Import mrowa2 nie powinien nic wypisywać (demo uruchamia tylko --demo)"
+    assert lines[1] == "[]", "Import mrowa2 nie powinien budować grafu ani rozwiązywać"
+
+
+def test_import_time_beyond_numpy():
+    import_mrowa2()                                                         # Warm up bytecode caches
+    numpy_time, mrowa2_time = map(float, import_mrowa2()[0].split())
+    assert mrowa2_time < 0.1, f"Import mrowa2 poza numpy trwa {mrowa2_time:.3f}s (numpy {numpy_time:.3f}s)"
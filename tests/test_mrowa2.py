@@ -0,0 +1,168 @@
+import time
+
+import numpy as np
+import pytest
+
+import mrowa2
+
+
+def random_graph(seed, size, missing=0.3):
+    # Symmetric distance matrix with None where there is no connection, as in the mrowa2 demo
+    rng = np.random.default_rng(seed)
+    dist_m = rng.integers(10, 101, size=(size, size)).astype(object)
+    dist_m = np.triu(dist_m, 1) + np.triu(dist_m, 1).T
+    dist_m[rng.random((size, size)) < missing] = None
+    dist_m = np.where(np.equal(dist_m.T, None), None, dist_m)
+    np.fill_diagonal(dist_m, None)
+    return dist_m
+
+
+def random_orders(seed, size, count):
+    rng = np.random.default_rng(seed)
+    return [(int(p), int(d), int(rng.integers(50, 150))) for p, d in (rng.choice(size, 2, replace=False)
+                                                                      for _ in range(count))]
+
+
+def test_safe_legs_stop_when_asked():
+    matrix = random_graph(0, 20)
+    risk = np.where(np.equal(matrix, None), None, 0.1).astype(object)
+    orders = random_orders(0, 20, 6)
+    asked = []
+    aco = mrowa2.AntColonyOptimization(matrix, orders, 0, (1, 1, 1.0, 1.0, 0.1), objective="profit",
+                                       risk_matrix=risk, protection_cost=np.full(20, 5.0),
+                                       should_stop=lambda: asked.append(1) or len(asked) > 2)
+    assert len(asked) == len(orders)
+    assert np.all(aco.leg_cost[2:] == 1e9)
+    assert np.all(aco.leg_cost[:2] < 1e9)
+
+
+def test_fleet_pool_refinement_stops_on_callback():
+    matrix = random_graph(1, 30)
+    orders = random_orders(1, 30, 16)
+    fleet_done = []
+
+    def callback(history):
+        # Let the fleet colony finish, then stop the refinement running in worker processes
+        if not fleet_done:
+            fleet_done.append(time.time())
+            return False
+        return time.time() - fleet_done[0] > 0.5
+
+    start = time.time()
+    _, _, _, plan, _ = mrowa2.solve_fleet(matrix, orders, 0, (3, 10, 1.0, 2.0, 0.1), vehicles=4,
+                                          refine_iterations=100000, parallel_from=1, workers=2, seed=1,
+                                          callback=callback)
+    assert time.time() - start < 10
+    assert sorted(o for order_seq in plan for o in order_seq) == list(range(len(orders)))
+
+
+def path_length(weights, next_node, i, j):
+    # Walk next_node from i to j over direct edges
+    length, node = 0.0, i
+    for _ in range(len(weights)):
+        if node == j:
+            return length
+        step = next_node[node, j]
+        length += weights[node, step]
+        node = step
+    raise AssertionError(f"No path {i} -> {j} in next_node")
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_shortest_path_store_matches_full_recompute(seed):
+    rng = np.random.default_rng(seed)
+    store = mrowa2.ShortestPathStore(random_graph(seed, 12, missing=0.7))
+    store.shortest_paths()                                                  # Later updates go through _relax
+    for _ in range(40):
+        n = len(store.weights)
+        if rng.random() < 0.1:
+            store.add_node()
+            continue
+        u, v = rng.choice(n, 2, replace=False)
+        symmetric = bool(rng.random() < 0.7)
+        old = min(store.weights[u, v], store.weights[v, u]) if symmetric else store.weights[u, v]
+        weight = rng.uniform(1.0, 100.0) if np.isinf(old) else rng.uniform(0.5, 1.0) * old   # Insert or decrease
+        store.set_edge(int(u), int(v), weight, symmetric=symmetric)
+    assert not store.stale and store.full_recomputes == 1 and store.incremental_updates > 0
+
+    dist, next_node = mrowa2._floyd_warshall_arrays(store.weights.copy())
+    assert np.allclose(store.dist, dist)
+    reachable = (dist < 1e9) & ~np.eye(len(dist), dtype=bool)
+    assert np.array_equal(store.next_node >= 0, reachable)
+    for i, j in zip(*np.nonzero(reachable)):
+        assert path_length(store.weights, store.next_node, i, j) == pytest.approx(dist[i, j])
+
+
+def test_adopt_rejects_paths_of_another_graph():
+    store = mrowa2.ShortestPathStore(random_graph(0, 10))
+    other = mrowa2.ShortestPathStore(random_graph(1, 10))
+    dist, next_node, _, _ = other.shortest_paths()
+    with pytest.raises(ValueError):
+        store.adopt(dist, next_node, other.weights)
+    with pytest.raises(ValueError):
+        store.adopt(dist[:5, :5], next_node[:5, :5], store.weights)
+
+    dist, next_node = mrowa2._floyd_warshall_arrays(store.weights.copy())
+    store.adopt(dist, next_node, store.weights.copy())
+    assert not store.stale and store.dist is dist
+
+
+def tour_cost(aco, order_seq):
+    # Empty driving base -> pickup, delivery -> next pickup, ..., delivery -> base plus every loaded leg
+    stops = [aco.base_node] + [n for o in order_seq for n in aco.orders[o][:2]] + [aco.base_node]
+    empty = sum(aco.dist_matrix[a, b] for a, b in zip(stops[:-1:2], stops[1::2]))
+    return aco.distance_cost * empty + sum(aco.leg_cost[o] for o in order_seq)
+
+
+def visits_in_order(path, stops):
+    # stops (base, pickup, delivery, pickup, ..., base) appear in the built path in this order;
+    # a delivery in the node of the next pickup is a single visit
+    stops = [node for k, node in enumerate(stops) if k == 0 or node != stops[k - 1]]
+    position = 0
+    for node in path:
+        if position < len(stops) and node == stops[position]:
+            position += 1
+    return position == len(stops)
+
+
+def local_search_colony(seed, objective, cls=mrowa2.AntColonyOptimization, **kwargs):
+    matrix = random_graph(seed, 25, missing=0.5)
+    orders = random_orders(seed, 25, 9)
+    if objective == "profit":
+        kwargs.update(risk_matrix=np.where(np.equal(matrix, None), None, 0.2).astype(object),
+                      protection_cost=np.random.default_rng(seed).uniform(1.0, 30.0, 25), distance_cost=0.5)
+    return cls(matrix, orders, 0, (1, 1, 1.0, 1.0, 0.1), objective=objective, local_search=True, **kwargs)
+
+
+@pytest.mark.parametrize("objective", ["distance", "profit"])
+@pytest.mark.parametrize("seed", range(10))
+def test_local_search_keeps_orders_and_never_worsens(seed, objective):
+    aco = local_search_colony(seed, objective)
+    rng = np.random.default_rng(seed)
+    for _ in range(5):
+        order_seq = [int(o) for o in rng.permutation(len(aco.orders))]
+        seq, cost = aco._local_search(order_seq)
+        assert sorted(seq) == list(range(len(aco.orders)))
+        assert cost == pytest.approx(tour_cost(aco, seq))
+        assert cost <= tour_cost(aco, order_seq) + 1e-9
+        stops = [aco.base_node] + [n for o in seq for n in aco.orders[o][:2]] + [aco.base_node]
+        assert visits_in_order(aco._build_path(seq), stops)                 # Every pickup before its delivery
+
+
+@pytest.mark.parametrize("objective", ["distance", "profit"])
+@pytest.mark.parametrize("seed", range(10))
+def test_fleet_local_search_per_route(seed, objective):
+    fleet = local_search_colony(seed, objective, mrowa2.FleetAntColonyOptimization, vehicles=3)
+    rng = np.random.default_rng(seed)
+    for _ in range(5):
+        owner = rng.integers(0, fleet.vehicles, size=len(fleet.orders))
+        plan = [[int(o) for o in rng.permutation(np.flatnonzero(owner == v))] for v in range(fleet.vehicles)]
+        new_plan, cost = fleet._local_search(plan)
+        route_costs = [tour_cost(fleet, seq) for seq in new_plan]
+        assert cost == pytest.approx(fleet.fleet_cost(route_costs))
+        assert cost <= fleet.fleet_cost([tour_cost(fleet, seq) for seq in plan]) + 1e-9
+        for seq, old_seq, path in zip(new_plan, plan, fleet._build_path(new_plan)):
+            assert sorted(seq) == sorted(old_seq)                           # Orders stay with their vehicle
+            assert tour_cost(fleet, seq) <= tour_cost(fleet, old_seq) + 1e-9
+            stops = [fleet.base_node] + [n for o in seq for n in fleet.orders[o][:2]] + [fleet.base_node]
+            assert visits_in_order(path, stops)